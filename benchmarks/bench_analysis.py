@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for the analysis hot paths on synthetic issues (see synthetic.py).
+
+Times process_issue on typical and pathological (5,000-entry changelog) issues, comments_text,
+blocker_category_from_comment with one pattern and with a rule set of TAXONOMY_SIZE rules, every output mode and an end-to-end run of main() against an
+in-process fake JIRA with injected latency. Each case is run --repeat times, the best time is kept.
+
+    python3 benchmarks/bench_analysis.py [--scale 1.0] [--latency 0.005] [--output results.json]
+    python3 benchmarks/bench_analysis.py --baseline benchmarks/baseline.json [--tolerance 0.25]
+
+--output saves the results as JSON; with --baseline the run is compared to a saved result and the
+exit code is 1 if a case got slower than the tolerance allows.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import unittest.mock
+from datetime import datetime
+from functools import partial
+
+from synthetic import CATEGORIES, FakeJira, load_analyser, synthetic_issues
+
+analyser = load_analyser()
+
+TAXONOMY_SIZE = 40
+
+
+def best_time(func, repeat):
+    """Smallest wall time of repeat calls of func."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def prepared(raws):
+    """Issues as the search path hands them to process_issue."""
+    return [analyser.issue_from_raw(analyser.slim_issue_raw(raw)) for raw in raws]
+
+
+def fresh_caches():
+    """Forget the parsed timestamps and memoised categories, so every repetition computes them again."""
+    analyser.parse_jira_time.cache_clear()
+    analyser.pattern_rules.cache_clear()
+
+
+def taxonomy(size):
+    """--category-rules of the given size as CategoryRules arguments: per category a hashtag, {...} and [...] pattern
+    and keyword synonyms, the synthetic #categories at the end and a catch-all hashtag rule."""
+    rules, keywords = [], {}
+    for number in range(size):
+        rules += [(f'Category {number}', pattern) for pattern in (rf'#cat{number}\b', rf'\{{cat{number}\}}', rf'\[cat{number}\]')]
+        keywords.update({keyword: f'Category {number}' for keyword in (f'reason {number}', f'cause{number}', f'because of {number}')})
+    rules += [(category[1:].title(), category + r'\b') for category in CATEGORIES]
+    rules.append((None, r'#\w+'))
+    return rules, keywords
+
+
+def bench_process_issue(issues, repeat):
+    def run():
+        fresh_caches()
+        for issue in issues:
+            analyser.process_issue(None, issue)
+    return best_time(run, repeat)
+
+
+def bench_comment_lookups(issues, repeat):
+    """comments_text and blocker_category_from_comment for every flag cycle of the issues, on one CommentIndex per issue."""
+    cases = []
+    for issue in issues:
+        for blocker in analyser.process_issue(None, issue):
+            cases.append((issue.fields.comment.comments, blocker.flag_set_time, blocker.flag_removed_time))
+
+    def run_text():
+        fresh_caches()
+        indexes = {}
+        for comments, flag_set, flag_removed in cases:
+            index = indexes.setdefault(id(comments), analyser.CommentIndex(comments))
+            analyser.comments_text(index, flag_set, flag_removed)
+
+    def run_category(pattern):
+        fresh_caches()
+        rules = analyser.CategoryRules(*pattern) if isinstance(pattern, tuple) else pattern
+        indexes = {}
+        for comments, flag_set, flag_removed in cases:
+            index = indexes.setdefault(id(comments), analyser.CommentIndex(comments))
+            analyser.blocker_category_from_comment(index, flag_set, rules, flag_removed)
+
+    rules = taxonomy(TAXONOMY_SIZE)
+    return (len(cases), best_time(run_text, repeat), best_time(partial(run_category, r'#\w+'), repeat),
+            best_time(partial(run_category, rules), repeat))
+
+
+def bench_writer(mode, blockers, repeat):
+    """Seconds to write the blockers with the --mode writer, None if its optional dependency is missing."""
+    def run():
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            with analyser.WRITERS[mode](os.path.join(tmp, 'blockers'), 'days') as writer:
+                for blocker in blockers:
+                    writer.write(blocker)
+    try:
+        return best_time(run, repeat)
+    except ImportError:
+        return None
+
+
+def bench_end_to_end(raws, latency, workers, repeat):
+    """main() in csv mode against FakeJira; returns (seconds, requests of the last run)."""
+    jira = FakeJira(analyser, raws, latency=latency)
+
+    def run():
+        fresh_caches()
+        jira.calls = 0
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            argv = ['jira-blocker-analyser', '--mode', 'csv', '--output-file', os.path.join(tmp, 'blockers'),
+                    '--shard-days', '0', '--workers', str(workers), '--page-size', '100']
+            with unittest.mock.patch.object(sys, 'argv', argv), \
+                    unittest.mock.patch.object(analyser, 'connect_jira', lambda *args: jira):
+                analyser.main()
+    return best_time(run, repeat), jira.calls
+
+
+def run_suite(args):
+    scaled = lambda count: max(1, int(count * args.scale))
+    typical = prepared(synthetic_issues(scaled(2000), seed=1, histories=30, flag_cycles=3, comments=20))
+    pathological = prepared(synthetic_issues(scaled(20), seed=2, histories=5000, flag_cycles=250, comments=2000))
+    results = {}
+
+    def record(name, seconds, items):
+        results[name] = {'seconds': round(seconds, 6), 'items': items, 'us_per_item': round(seconds / items * 1e6, 3)}
+        print(f'{name:<40} {seconds:9.4f}s  {items:>7} items  {seconds / items * 1e6:10.1f} us/item')
+
+    analyser.category_pattern = r'#\w+'
+    record('process_issue/typical', bench_process_issue(typical, args.repeat), len(typical))
+    record('process_issue/pathological', bench_process_issue(pathological, args.repeat), len(pathological))
+
+    count, text, category, rules = bench_comment_lookups(typical + pathological, args.repeat)
+    record('comments_text', text, count)
+    record('blocker_category_from_comment', category, count)
+    record(f'category_rules/{TAXONOMY_SIZE} rules', rules, count)
+
+    blockers = [blocker for issue in typical for blocker in analyser.process_issue(None, issue)]
+    for mode in analyser.WRITERS:
+        seconds = bench_writer(mode, blockers, args.repeat)
+        if seconds is None:
+            print(f'{"mode/" + mode:<40} skipped, optional dependency is not installed')
+        else:
+            record(f'mode/{mode}', seconds, len(blockers))
+
+    raws = synthetic_issues(scaled(500), seed=3, histories=150, flag_cycles=3, comments=120)
+    seconds, calls = bench_end_to_end(raws, args.latency, args.workers, args.repeat)
+    record('end_to_end', seconds, len(raws))
+    results['end_to_end']['requests'] = calls
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the ratio to the baseline per case; True if no case is slower than 1 + tolerance times its baseline."""
+    ok = True
+    print(f'\nCompared to the baseline of {baseline["meta"]["date"]} (tolerance {tolerance:.0%}):')
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if not base:
+            print(f'{name:<40} new')
+            continue
+        ratio = result['us_per_item'] / base['us_per_item']
+        regression = ratio > 1 + tolerance
+        ok = ok and not regression
+        print(f'{name:<40} x{ratio:5.2f}{"  REGRESSION" if regression else ""}')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the blocker analysis')
+    parser.add_argument('--scale', default=1.0, type=float, help='Multiplier for the number of synthetic issues')
+    parser.add_argument('--repeat', default=3, type=int, help='Runs per case, the best time is kept')
+    parser.add_argument('--latency', default=0.005, type=float, help='Seconds per request of the fake Jira in the end-to-end run')
+    parser.add_argument('--workers', default=4, type=int, help='--workers of the end-to-end run')
+    parser.add_argument('--output', type=str, help='Save the results to this JSON file')
+    parser.add_argument('--baseline', type=str, help='Compare the results to this JSON file saved with --output')
+    parser.add_argument('--tolerance', default=0.25, type=float, help='Allowed slowdown against the baseline, 0.25 = 25%%')
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': {name: getattr(args, name) for name in ('scale', 'repeat', 'latency', 'workers')},
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Cold-start benchmark: wall time of fresh interpreter processes running the tool, as cron jobs and CI do.
+
+Cases: the bare interpreter (for reference), --help through the package and through the old script name,
+and an offline --mode csv run on a small synthetic export (see synthetic.py). Each case is run once to write
+the bytecode caches, as an installed package has them, then --repeat times; the best and the median are kept.
+
+    python3 benchmarks/bench_startup.py [--repeat 10] [--issues 200] [--imports] [--output results.json]
+    python3 benchmarks/bench_startup.py --baseline startup.json [--tolerance 0.25]
+
+--imports prints the modules that take longest to import for --help (python -X importtime).
+With --baseline the exit code is 1 if the best time of a case got slower than the tolerance allows.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from synthetic import ROOT, synthetic_issues
+
+
+def child_env():
+    """Environment of the measured processes: bytecode is cached as for an installed package."""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def run_times(command, repeat):
+    """Wall times of repeat runs of command, after one warm-up run."""
+    env = child_env()
+    subprocess.run(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def slowest_imports(command, count=15):
+    """(cumulative microseconds, module) of the slowest top-level imports of command."""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + command[1:], cwd=ROOT, env=child_env(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2].startswith('  '):
+            imports.append((int(parts[1]), parts[2].strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def run_suite(args, tmp):
+    export = os.path.join(tmp, 'export.json')
+    with open(export, 'w', encoding='utf-8') as f:
+        json.dump(synthetic_issues(args.issues, seed=4, histories=30, flag_cycles=3, comments=20), f)
+    cases = {
+        'python': [sys.executable, '-c', 'pass'],
+        'help': [sys.executable, '-m', 'jira_blocker_analyser', '--help'],
+        'help/old script': [sys.executable, 'jira-blocker-analyser.py', '--help'],
+        'offline csv': [sys.executable, '-m', 'jira_blocker_analyser', '--input-file', export, '--mode', 'csv',
+                        '--output-file', os.path.join(tmp, 'blockers')],
+    }
+    results = {}
+    for name, command in cases.items():
+        times = run_times(command, args.repeat)
+        results[name] = {'seconds': round(min(times), 6), 'median': round(statistics.median(times), 6)}
+        print(f'{name:<20} best {min(times) * 1000:8.1f} ms  median {statistics.median(times) * 1000:8.1f} ms')
+    if args.imports:
+        print('\nSlowest imports of --help (cumulative):')
+        for microseconds, module in slowest_imports(cases['help']):
+            print(f'{microseconds / 1000:8.1f} ms  {module}')
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the ratio to the baseline per case; True if no case is slower than 1 + tolerance times its baseline."""
+    ok = True
+    print(f'\nCompared to the baseline of {baseline["meta"]["date"]} (tolerance {tolerance:.0%}):')
+    for name, result in results.items():
+        base = baseline['results'].get(name)
+        if not base:
+            print(f'{name:<20} new')
+            continue
+        ratio = result['seconds'] / base['seconds']
+        regression = ratio > 1 + tolerance
+        ok = ok and not regression
+        print(f'{name:<20} x{ratio:5.2f}{"  REGRESSION" if regression else ""}')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start time of the jira-blocker-analyser command')
+    parser.add_argument('--repeat', default=10, type=int, help='Runs per case after a warm-up run')
+    parser.add_argument('--issues', default=200, type=int, help='Issues in the export of the offline csv case')
+    parser.add_argument('--imports', action='store_true', help='Print the slowest imports of --help')
+    parser.add_argument('--output', type=str, help='Save the results to this JSON file')
+    parser.add_argument('--baseline', type=str, help='Compare the results to this JSON file saved with --output')
+    parser.add_argument('--tolerance', default=0.25, type=float, help='Allowed slowdown against the baseline, 0.25 = 25%%')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_suite(args, tmp)
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': {'repeat': args.repeat, 'issues': args.issues},
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmark: parse_jira_time against datetime.strptime on a synthetic changelog.
+
+    python3 benchmarks/bench_timestamps.py [--count 1000000]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from synthetic import load_analyser
+
+parse_jira_time = load_analyser().parse_jira_time
+
+
+def synthetic_changelog_times(count, seed=1):
+    """Jira-formatted history timestamps, increasing by a random step, as in a long changelog."""
+    rng = random.Random(seed)
+    moment = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    times = []
+    for _ in range(count):
+        moment += timedelta(seconds=rng.randint(1, 3600), milliseconds=rng.randint(0, 999))
+        times.append(moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}+0000')
+    return times
+
+
+def timed(func, values):
+    start = time.perf_counter()
+    for value in values:
+        func(value)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Timestamp parsing benchmark')
+    parser.add_argument('--count', default=1_000_000, type=int, help='Number of changelog timestamps')
+    args = parser.parse_args()
+
+    values = synthetic_changelog_times(args.count)
+    # every history entry is parsed again by the comment lookups of the same issue
+    repeated = [value for value in values for _ in range(2)]
+
+    strptime = timed(lambda value: datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f%z'), values)
+    parse_jira_time.cache_clear()
+    fast = timed(parse_jira_time, values)
+    strptime_repeated = timed(lambda value: datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f%z'), repeated)
+    parse_jira_time.cache_clear()
+    fast_repeated = timed(parse_jira_time, repeated)
+
+    print(f'{args.count} unique timestamps:   strptime {strptime:.2f}s, parse_jira_time {fast:.2f}s, x{strptime / fast:.1f}')
+    print(f'{len(repeated)} with repeats:     strptime {strptime_repeated:.2f}s, parse_jira_time {fast_repeated:.2f}s, x{strptime_repeated / fast_repeated:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Synthetic Jira data for the benchmarks: issues in REST JSON form and an in-process fake JIRA client.
+
+Issues look like the search results of a real Jira: flag cycles with a "(flag) Flag added" comment carrying
+a #category at the moment the flag is set, status changes, changelog noise (assignee, description...)
+that the analyser drops, and comments spread over the issue lifetime.
+"""
+import importlib
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CATEGORIES = ['#infra', '#vendor', '#review', '#deployment', '#access', '#customer']
+STATUSES = ['To Do', 'In Progress', 'Review', 'Testing', 'Done']
+NOISE_FIELDS = ['assignee', 'description', 'labels', 'priority', 'Sprint', 'Story Points']
+
+
+def load_analyser():
+    """The jira_blocker_analyser.analyser module of this checkout."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return importlib.import_module('jira_blocker_analyser.analyser')
+
+
+def jira_time(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f'{moment.microsecond // 1000:03d}+0000'
+
+
+def synthetic_issue(key, rng, histories=30, flag_cycles=3, comments=20, start=datetime(2023, 1, 2, tzinfo=timezone.utc)):
+    """REST JSON of an issue (search result with expand=changelog) with the given number of changelog entries,
+    2 * flag_cycles of them flag changes, and about the given number of comments (plus one per flag set)."""
+    histories = max(histories, 2 * flag_cycles)
+    moment = start + timedelta(minutes=rng.randint(0, 60 * 24 * 300))
+    times = []
+    for _ in range(histories):
+        moment += timedelta(seconds=rng.randint(60, 3 * 86400), milliseconds=rng.randint(0, 999))
+        times.append(moment)
+    flag_positions = sorted(rng.sample(range(histories), 2 * flag_cycles))
+    flag_changes = {position: index % 2 == 0 for index, position in enumerate(flag_positions)}  # True: set
+
+    entries = []
+    issue_comments = []
+    for position, created in enumerate(times):
+        if position in flag_changes:
+            if flag_changes[position]:
+                items = [{'field': 'Flagged', 'fromString': None, 'toString': 'Impediment'}]
+                issue_comments.append((created, f'(flag) Flag added\n\n{rng.choice(CATEGORIES)} waiting for a fix'))
+            else:
+                items = [{'field': 'Flagged', 'fromString': 'Impediment', 'toString': None}]
+        elif rng.random() < 0.4:
+            old, new = rng.sample(STATUSES, 2)
+            items = [{'field': 'status', 'fromString': old, 'toString': new}]
+        else:
+            items = [{'field': rng.choice(NOISE_FIELDS), 'fromString': 'old value', 'toString': 'new value'}]
+        entries.append({'id': str(position), 'created': jira_time(created), 'items': items})
+
+    for _ in range(comments):
+        created = times[0] + (times[-1] - times[0]) * rng.random()
+        issue_comments.append((created, f'Comment {rng.randint(0, 10 ** 6)}: ' + 'lorem ipsum ' * rng.randint(1, 30)))
+    issue_comments.sort(key=lambda pair: pair[0])
+
+    return {
+        'key': key,
+        'fields': {
+            'summary': f'Synthetic issue {key}',
+            'updated': jira_time(times[-1]),
+            'comment': {
+                'startAt': 0, 'maxResults': len(issue_comments), 'total': len(issue_comments),
+                'comments': [{'id': str(index), 'created': jira_time(created), 'body': body}
+                             for index, (created, body) in enumerate(issue_comments)],
+            },
+        },
+        'changelog': {'startAt': 0, 'maxResults': len(entries), 'total': len(entries), 'histories': entries},
+    }
+
+
+def synthetic_issues(count, seed=1, prefix='PROJ', **shape):
+    """count issues of the same shape (see synthetic_issue), reproducible for a seed."""
+    rng = random.Random(seed)
+    return [synthetic_issue(f'{prefix}-{number}', rng, **shape) for number in range(1, count + 1)]
+
+
+class FakeJira:
+    """In-process stand-in for the jira.JIRA client methods used by the analyser.
+    Every call sleeps for latency seconds (the network round trip) and is counted in calls.
+    Like Jira, search results embed at most embedded_limit changelog entries and comments,
+    the rest is paged through the changelog and comment endpoints."""
+
+    def __init__(self, analyser, issues, latency=0.0, embedded_limit=100):
+        self.analyser = analyser  # for issue_from_raw in issue()
+        self.issues = issues
+        self.by_key = {issue['key']: issue for issue in issues}
+        self.latency = latency
+        self.embedded_limit = embedded_limit
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _request(self):
+        with self.lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _search_result(self, issue, fields, expand):
+        names = (fields or 'summary,comment').split(',')
+        result = {'key': issue['key'], 'fields': {name: issue['fields'][name] for name in names if name in issue['fields']}}
+        comment = result['fields'].get('comment')
+        if comment:
+            result['fields']['comment'] = dict(comment, comments=comment['comments'][:self.embedded_limit])
+        if expand and 'changelog' in expand:
+            changelog = issue['changelog']
+            result['changelog'] = dict(changelog, histories=changelog['histories'][:self.embedded_limit])
+        return result
+
+    def search_issues(self, jql_str, startAt=0, maxResults=50, fields=None, expand=None, json_result=False, **kwargs):
+        """Every issue matches any query; pages are capped at 100 issues as on Jira Cloud."""
+        self._request()
+        page = self.issues[startAt:startAt + min(maxResults, 100)]
+        return {'startAt': startAt, 'maxResults': len(page), 'total': len(self.issues),
+                'issues': [self._search_result(issue, fields, expand) for issue in page]}
+
+    def _get_json(self, path, params=None):
+        self._request()
+        params = params or {}
+        parts = path.split('/')
+        issue = self.by_key[parts[1]]
+        if len(parts) == 2:  # issue/{key}?expand=changelog
+            return issue
+        entries = issue['changelog']['histories'] if parts[2] == 'changelog' else issue['fields']['comment']['comments']
+        start_at = params.get('startAt', 0)
+        page = entries[start_at:start_at + params.get('maxResults', 50)]
+        return {'startAt': start_at, 'maxResults': len(page), 'total': len(entries),
+                'values' if parts[2] == 'changelog' else 'comments': page}
+
+    def issue(self, key, expand=None):
+        self._request()
+        return self.analyser.issue_from_raw(self.by_key[key])
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Blocker clustering for Jira: flagged blockers of issues with their duration, category and comments.
+
+The command line tool is jira_blocker_analyser.analyser.main (the jira-blocker-analyser command).
+Optional dependencies (jira, pandas, numpy, pyarrow, openpyxl, PyYAML) are imported only by the code paths
+that need them, so importing the package and --help stay fast.
+"""
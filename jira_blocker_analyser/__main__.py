@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""python -m jira_blocker_analyser"""
+from .analyser import main
+
+main()
@@ -0,0 +1,2192 @@
+# -*- coding: utf-8 -*-
+import argparse
+import gzip
+import json
+import mmap
+import os
+import queue
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from operator import attrgetter
+from itertools import islice
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+from datetime import date, datetime, timedelta, timezone
+from bisect import bisect_left, bisect_right
+import csv
+
+# Fields requested from search_issues in bulk-fetch mode, only what process_issue reads
+SEARCH_FIELDS = 'summary,comment'
+# Search result pages read ahead per shard while the earlier shards are consumed
+SEARCH_PREFETCH_PAGES = 2
+# Issue fields kept in the on-disk cache
+CACHED_FIELDS = ('summary', 'comment', 'updated')
+# Page sizes of the dedicated changelog and comment endpoints (Jira Cloud caps changelog pages at 100)
+CHANGELOG_PAGE_SIZE = 100
+COMMENT_PAGE_SIZE = 1000
+# Changelog items used by process_issue, all others are dropped right after the JSON is decoded
+CHANGELOG_FIELDS = ('Flagged', 'status')
+# CSV output is flushed to disk every this many rows
+FLUSH_EVERY = 100
+# Blockers per row group / record batch of the parquet and feather outputs
+ROW_GROUP_SIZE = 10000
+# Bucket edges (seconds) of the blocked time histogram in the summary report
+HISTOGRAM_EDGES = [0, 3600, 4 * 3600, 86400, 2 * 86400, 5 * 86400, 10 * 86400, 30 * 86400, float('inf')]
+HISTOGRAM_LABELS = ['< 1h', '1h - 4h', '4h - 1d', '1d - 2d', '2d - 5d', '5d - 10d', '10d - 30d', '>= 30d']
+# Summary columns holding blocked time, converted to --time-unit for display
+TIME_COLUMNS = ['Total', 'Mean', 'Median', 'P85', 'P95']
+# Period length and label format of the --mode timeline series
+TIMELINE_STEPS = {'day': (timedelta(days=1), '%Y-%m-%d'), 'hour': (timedelta(hours=1), '%Y-%m-%d %H:00')}
+# Characters read from a JSON export at a time (more while a single value does not fit)
+INPUT_BUFFER_SIZE = 1 << 20
+# Bytes of an NDJSON dump parsed by one process at a time
+INPUT_CHUNK_SIZE = 16 << 20
+# File extensions of line-delimited dumps, which are split into chunks parsed in parallel
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+# Output column with blocked working time, present only with --calendar working-hours
+WORKING_TIME = 'Working Time Blocked'
+# Journal lines written between fsync calls
+JOURNAL_SYNC_EVERY = 100
+# Output columns of the target an issue was found by, present only in runs over several targets
+TARGET_COLUMNS = ['Project', 'Team']
+# Keys of an entry in a --category-rules file
+RULE_KEYS = {'category', 'pattern', 'patterns', 'keywords'}
+# Comments whose category is memoised by CategoryRules, the memo is cleared when full
+CATEGORY_MEMO_SIZE = 1 << 18
+# Keys of an entry in a --targets file
+TARGET_KEYS = {'name', 'project', 'team', 'jql'}
+# Blocker store of --mode sqlite: one row per (issue, flag set time), times in UTC as 'YYYY-MM-DD HH:MM:SS';
+# open_blockers holds the issues flagged now and is maintained by --serve
+STORE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blockers (
+    issue_key TEXT NOT NULL,
+    flag_set_time TEXT NOT NULL,
+    flag_removed_time TEXT NOT NULL,
+    issue_summary TEXT,
+    seconds REAL NOT NULL,
+    working_seconds REAL,
+    category TEXT NOT NULL,
+    comments TEXT,
+    flag_was_not_removed INTEGER NOT NULL,
+    project TEXT,
+    team TEXT,
+    stored_at TEXT NOT NULL,
+    PRIMARY KEY (issue_key, flag_set_time)
+);
+CREATE INDEX IF NOT EXISTS blockers_category ON blockers (category, flag_set_time);
+CREATE INDEX IF NOT EXISTS blockers_set_time ON blockers (flag_set_time);
+CREATE INDEX IF NOT EXISTS blockers_project ON blockers (project, flag_set_time);
+CREATE TABLE IF NOT EXISTS open_blockers (
+    issue_key TEXT PRIMARY KEY,
+    issue_summary TEXT,
+    flag_set_time TEXT NOT NULL,
+    category TEXT NOT NULL,
+    project TEXT,
+    stored_at TEXT NOT NULL
+);
+'''
+STORE_UPSERT = '''
+INSERT INTO blockers (issue_key, flag_set_time, flag_removed_time, issue_summary, seconds, working_seconds, category,
+                      comments, flag_was_not_removed, project, team, stored_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (issue_key, flag_set_time) DO UPDATE SET
+    flag_removed_time = excluded.flag_removed_time, issue_summary = excluded.issue_summary,
+    seconds = excluded.seconds, working_seconds = excluded.working_seconds, category = excluded.category,
+    comments = excluded.comments, flag_was_not_removed = excluded.flag_was_not_removed,
+    project = excluded.project, team = excluded.team, stored_at = excluded.stored_at
+'''
+# Summary row for blockers without a category
+NO_CATEGORY = '(no category)'
+# Mandatory clause appended to every search: only issues that were ever flagged
+FLAG_CLAUSE = ' and comment ~ "(flag) Flag added"'
+
+NON_SPACE = re.compile(r'\S')
+# Issue key or id in a REST path, replaced by {key} to count requests per endpoint
+ISSUE_IN_PATH = re.compile(r'/issue/[^/]+')
+# Upper bounds in seconds of the Jira request latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf')]
+# Server errors retried by the transport for GET requests (429 is left to call_with_retry and the shared RateLimiter)
+RETRY_STATUSES = (500, 502, 503, 504)
+# Seconds between updates of the progress line
+PROGRESS_INTERVAL = 0.5
+
+
+class RateLimiter:
+    """Shared by all worker threads. After HTTP 429 every worker pauses until Retry-After has passed;
+    the fallback delay doubles on repeated throttling and shrinks back on successful calls."""
+
+    def __init__(self, base_delay=1.0, max_delay=60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._delay = base_delay
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            pause = self._resume_at - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+
+    def throttled(self, retry_after=None):
+        with self._lock:
+            delay = retry_after if retry_after is not None else self._delay
+            self._delay = min(self._delay * 2, self.max_delay)
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+        return delay
+
+    def succeeded(self):
+        with self._lock:
+            self._delay = max(self.base_delay, self._delay / 2)
+
+
+rate_limiter = RateLimiter()
+
+
+class RunMetrics:
+    """Counters of one run, shared by all worker threads: wall and CPU time per phase (summed over the threads
+    working in it), Jira requests and response bytes per endpoint, a request latency histogram and retries."""
+
+    def __init__(self):
+        self.phases = {}
+        self.endpoints = {}
+        self.latency_counts = [0] * len(LATENCY_BUCKETS)
+        self.retries = 0
+        self.expected_issues = 0  # 'total' of the search queries, for the ETA
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            with self._lock:
+                totals = self.phases.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+                totals['calls'] += 1
+                totals['wall'] += wall
+                totals['cpu'] += cpu
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def found(self, total):
+        with self._lock:
+            self.expected_issues += total
+
+    def install(self, jira):
+        """Count the requests of a jira.JIRA client through the response hook of its requests session."""
+        session = getattr(jira, '_session', None)
+        if session is not None:
+            session.hooks['response'].append(self.response_hook)
+
+    def response_hook(self, response, *args, **kwargs):
+        request = response.request
+        endpoint = f'{request.method} {ISSUE_IN_PATH.sub("/issue/{key}", urlsplit(request.url).path)}'
+        size = len(response.content)
+        bucket = bisect_left(LATENCY_BUCKETS, response.elapsed.total_seconds())
+        with self._lock:
+            counts = self.endpoints.setdefault(endpoint, {'requests': 0, 'bytes': 0, 'errors': 0})
+            counts['requests'] += 1
+            counts['bytes'] += size
+            counts['errors'] += response.status_code >= 400
+            self.latency_counts[bucket] += 1
+
+    def report(self):
+        """All counters as a JSON-serialisable dict."""
+        labels = [f'<= {bound}s' for bound in LATENCY_BUCKETS[:-1]] + [f'> {LATENCY_BUCKETS[-2]}s']
+        with self._lock:
+            return {
+                'phases': {name: dict(totals) for name, totals in self.phases.items()},
+                'endpoints': {name: dict(counts) for name, counts in self.endpoints.items()},
+                'requests': sum(counts['requests'] for counts in self.endpoints.values()),
+                'latency_histogram': dict(zip(labels, self.latency_counts)),
+                'retries': self.retries,
+            }
+
+
+metrics = RunMetrics()
+# WorkingCalendar set by --calendar working-hours, None for wall-clock time only
+working_calendar = None
+# --category-in-interval: look for the category in the comments of the whole blocked interval
+category_in_interval = False
+# True when several projects / teams are analysed in one run: blockers are output with their Project and Team
+target_columns = False
+
+
+def call_with_retry(func, *args, max_retries=5, **kwargs):
+    """Call a Jira API function, waiting and retrying while the server answers HTTP 429 Too Many Requests."""
+    for attempt in range(max_retries + 1):
+        rate_limiter.wait()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_retries or getattr(e, 'status_code', None) != 429:
+                raise
+            rate_limiter.throttled(_retry_after(e))
+            metrics.retried()
+            continue
+        rate_limiter.succeeded()
+        return result
+
+
+def http_adapter(pool_size, retries, backoff_factor=0.5):
+    """requests adapter keeping up to pool_size keep-alive connections per host. With pool_block a thread waits
+    for a free connection instead of opening a throwaway one. Idempotent requests (GET, HEAD, OPTIONS) that fail
+    on a connection error, a read timeout or a 5xx status are retried up to retries times; the delay grows
+    exponentially and is drawn at random below it ("full jitter"), so workers failing together do not retry
+    in lockstep, and Retry-After of a 503 is honoured. HTTP 429 is never retried here: it reaches call_with_retry,
+    which pauses all workers through the shared rate_limiter."""
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class JitteredRetry(Retry):
+        # urllib3 retries 413, 429 and 503 responses with Retry-After even outside status_forcelist
+        RETRY_AFTER_STATUS_CODES = frozenset({503})
+
+        def get_backoff_time(self):
+            return random.uniform(0, super().get_backoff_time())
+
+    retry = JitteredRetry(total=retries, connect=retries, read=retries, status=retries, other=0,
+                          allowed_methods=frozenset({'GET', 'HEAD', 'OPTIONS'}), status_forcelist=RETRY_STATUSES,
+                          backoff_factor=backoff_factor, respect_retry_after_header=True, raise_on_status=False)
+    return HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+
+
+def configure_session(session, pool_size, retries, backoff_factor=0.5):
+    """Mount the pooled, retrying adapter on a requests session and ask for compressed responses
+    (requests decompresses gzip and deflate bodies)."""
+    adapter = http_adapter(pool_size, retries, backoff_factor)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+
+def connect_jira(server, user, password, pool_size, timeout, retries):
+    """JIRA client on the configured transport. The client's own retry loop is switched off (max_retries=0),
+    so transient errors are retried in one place: the adapter, and call_with_retry for HTTP 429."""
+    from jira import JIRA
+    client = JIRA(server=server, basic_auth=(user, password), timeout=timeout, max_retries=0)
+    configure_session(client._session, pool_size, retries)
+    return client
+
+
+def _retry_after(error):
+    """Retry-After header of a JIRAError response in seconds, None if absent or not a number."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_fully_expanded(issue):
+    """True if the issue already carries its complete changelog and comments (e.g. from search_issues with expand=changelog)."""
+    return has_full_changelog(issue) and has_full_comments(issue)
+
+
+def has_full_changelog(issue):
+    changelog = getattr(issue, 'changelog', None)
+    return changelog is not None and _is_complete(changelog, changelog.histories)
+
+
+def has_full_comments(issue):
+    comment = getattr(issue.fields, 'comment', None)
+    return comment is not None and _is_complete(comment, comment.comments)
+
+
+def _is_complete(container, items):
+    """Jira paginates embedded lists: complete only if all 'total' entries are present."""
+    total = getattr(container, 'total', None)
+    if not isinstance(total, int) or isinstance(total, bool):
+        return False
+    return len(items) >= total
+
+
+def date_shard_queries(base_query, start_date, shard_days, today=None):
+    """Split 'resolutiondate >= start_date' into windows of shard_days days, one JQL query per window.
+    The last window is open-ended. Returns an empty list if the date is not a YYYY-MM-DD date or sharding is off."""
+    if shard_days <= 0:
+        return []
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return []
+    today = today or date.today()
+    prefix = f'{base_query} and ' if base_query else ''
+    queries = []
+    while True:
+        shard_end = start + timedelta(days=shard_days)
+        if shard_end > today:
+            queries.append(f'{prefix}resolutiondate >= {start}{FLAG_CLAUSE}')
+            return queries
+        queries.append(f'{prefix}resolutiondate >= {start} and resolutiondate < {shard_end}{FLAG_CLAUSE}')
+        start = shard_end
+
+
+def search_all(jira, jql_query, page_size, phase='search', **search_options):
+    """Yield the issues matching the query page by page, as lists; a page is requested only when the previous one
+    is consumed. Stops on the 'total' reported by Jira, without the trailing empty page. Jira Cloud answers the first
+    page with the enhanced search, which has no 'total' and refuses startAt > 0: the following pages are requested
+    with its nextPageToken until 'isLast' or an empty page.
+    Works on the raw search JSON, the jira library does not build Resource objects for the results.
+    Time is counted in the given metrics phase; totals of the 'search' phase give the expected number of issues."""
+    start_at = 0
+    page = None
+    while True:
+        with metrics.phase(phase):
+            if page is not None and page.get('total') is None:
+                page = call_with_retry(jira.enhanced_search_issues, jql_query, nextPageToken=page['nextPageToken'],
+                                       maxResults=page_size, json_result=True, **search_options)
+            else:
+                page = call_with_retry(jira.search_issues, jql_query, startAt=start_at, maxResults=page_size,
+                                       json_result=True, **search_options)
+            chunk = page.get('issues', [])
+            issues = [issue_from_raw(slim_issue_raw(raw)) for raw in chunk]
+        total = page.get('total')
+        if start_at == 0 and phase == 'search' and total is not None:
+            metrics.found(total)
+        if issues:
+            yield issues
+        start_at += len(chunk)  # the server may return less than page_size
+        if len(chunk) == 0 or (total is not None and start_at >= total):
+            return
+        if total is None and (page.get('isLast') or not page.get('nextPageToken')):
+            return
+
+
+class Target:
+    """A project / team / JQL selection analysed in a run, with the shard queries its issues are searched with."""
+
+    def __init__(self, name, base_query, project=None, team=None, queries=()):
+        self.name = name
+        self.base_query = base_query
+        self.project = project
+        self.team = team
+        self.queries = list(queries)
+        self.jql_query = base_query  # with the date and flag clauses, as printed
+
+    def __repr__(self):
+        return f'Target({self.name!r})'
+
+
+def target_query(jql=None, project=None, team=None):
+    """JQL of a target without the resolution date and flag clauses."""
+    clauses = [jql] if jql else []
+    if project:
+        clauses.append(f'project = {project}')
+    if team:
+        clauses.append(f'Team = {team}')
+    return ' and '.join(clauses)
+
+
+def split_list(value):
+    """Items of a comma-separated command line value, [] for None."""
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def make_targets(jql=None, projects=(), teams=(), entries=None):
+    """Targets for every combination of the projects and teams, or for the entries of a targets file
+    (dicts with optional name, project, team and jql). The common jql is added to every target."""
+    if entries is None:
+        entries = [{'project': project, 'team': team} for project in projects or [None] for team in teams or [None]]
+    targets = []
+    for entry in entries:
+        project, team = entry.get('project'), entry.get('team')
+        base_query = target_query(' and '.join(clause for clause in (jql, entry.get('jql')) if clause), project, team)
+        name = entry.get('name') or ' / '.join(str(value) for value in (project, team) if value) or base_query or 'all'
+        targets.append(Target(name, base_query, project, team))
+    return targets
+
+
+def load_targets(path):
+    """Entries of a YAML targets file: a list of mappings with name, project, team and jql keys,
+    or a mapping with such a list under 'targets'. Requires PyYAML."""
+    import yaml
+    with open(path, encoding='utf-8') as f:
+        entries = yaml.safe_load(f) or []
+    if isinstance(entries, dict):
+        entries = entries.get('targets') or []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.keys() <= TARGET_KEYS:
+            raise ValueError(f'Target entries in {path} must be mappings with keys {sorted(TARGET_KEYS)}: {entry!r}')
+    return entries
+
+
+def search_targets(jira, targets, page_size, workers=1, **search_options):
+    """Run the shard queries of all targets on one pool of workers sharing the Jira client and yield
+    (target, issue) pairs in target and shard order, de-duplicated by issue key within a target."""
+    def shard(target, query):
+        for page in search_all(jira, query, page_size, **search_options):
+            yield target, page
+
+    shards = (shard(target, query) for target in targets for query in target.queries)
+    seen = set()
+    for target, page in prefetched(shards, workers):
+        for issue in page:
+            if (target.name, issue.key) not in seen:
+                seen.add((target.name, issue.key))
+                yield target, issue
+
+
+def paired(func, pairs):
+    """Apply an issue stream function that yields one result per issue in order (cached_full_issues,
+    process_issues) to the issues of (tag, issue) pairs; yields (tag, result)."""
+    tags = deque()
+
+    def issues():
+        for tag, issue in pairs:
+            tags.append(tag)
+            yield issue
+
+    for result in func(issues()):
+        yield tags.popleft(), result
+
+
+def search_sharded(jira, queries, page_size, workers=1, phase='search', **search_options):
+    """Run the shard queries in parallel and yield the issues in shard order, de-duplicated by issue key."""
+    shards = (search_all(jira, query, page_size, phase, **search_options) for query in queries)
+    seen_keys = set()
+    for page in prefetched(shards, workers):
+        for issue in page:
+            if issue.key not in seen_keys:
+                seen_keys.add(issue.key)
+                yield issue
+
+
+def ordered_map(func, items, workers, executor_class=ThreadPoolExecutor):
+    """Like executor.map, results in input order, but with at most 2 * workers items in flight,
+    so the input is consumed lazily and memory does not grow with its length."""
+    if workers <= 1:
+        yield from map(func, items)
+        return
+    with executor_class(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def prefetched(iterators, workers, ahead=SEARCH_PREFETCH_PAGES):
+    """Items of the iterators in order. Up to workers iterators are read at a time on worker threads, each at most
+    ahead items in front of the consumer, so with search pages at most workers * ahead pages wait in memory."""
+    if workers <= 1:
+        for iterator in iterators:
+            yield from iterator
+        return
+    stopped = threading.Event()
+
+    def put(buffer, entry):
+        while not stopped.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def drain(iterator, buffer):
+        try:
+            for item in iterator:
+                if not put(buffer, ('item', item)):
+                    return
+            put(buffer, ('end', None))
+        except BaseException as error:
+            put(buffer, ('error', error))
+
+    iterators = iter(iterators)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def start():
+            for iterator in islice(iterators, 1):
+                buffer = queue.Queue(maxsize=ahead)
+                executor.submit(drain, iterator, buffer)
+                running.append(buffer)
+
+        running = deque()
+        try:
+            for _ in range(workers):
+                start()
+            while running:
+                buffer = running.popleft()
+                while True:
+                    kind, value = buffer.get()
+                    if kind == 'error':
+                        raise value
+                    if kind == 'end':
+                        break
+                    yield value
+                start()
+        finally:
+            stopped.set()  # a consumer that stops early releases the threads waiting on full buffers
+
+
+def batched(items, size):
+    """Lists of up to size consecutive items."""
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def slim_issue_raw(raw):
+    """Only the parts of an issue's REST JSON used by the analysis. Changelog items other than Flagged and status
+    are dropped; 'total' is reduced by the number of dropped histories, so completeness checks still hold."""
+    fields = raw.get('fields') or {}
+    slim_fields = {name: fields[name] for name in CACHED_FIELDS if name in fields}
+    comment = fields.get('comment')
+    if comment:
+        comments = comment.get('comments', [])
+        slim_fields['comment'] = {
+            'startAt': comment.get('startAt', 0),
+            'maxResults': comment.get('maxResults', len(comments)),
+            'total': comment.get('total', len(comments)),
+            'comments': [{'id': c.get('id'), 'created': c['created'], 'body': c.get('body', '')} for c in comments],
+        }
+    slim = {'key': raw['key'], 'fields': slim_fields}
+    changelog = raw.get('changelog')
+    if changelog is not None:
+        histories = changelog.get('histories', [])
+        slim_histories = []
+        for history in histories:
+            items = [{'field': item['field'], 'fromString': item.get('fromString'), 'toString': item.get('toString')}
+                     for item in history.get('items', []) if item.get('field') in CHANGELOG_FIELDS]
+            if items:
+                slim_histories.append({'created': history['created'], 'items': items})
+        slim['changelog'] = {
+            'startAt': changelog.get('startAt', 0),
+            'maxResults': changelog.get('maxResults', len(histories)),
+            'total': changelog.get('total', len(histories)) - (len(histories) - len(slim_histories)),
+            'histories': slim_histories,
+        }
+    return slim
+
+
+def issue_from_raw(raw):
+    """Issue with attribute access (issue.fields.comment.comments, issue.changelog.histories...) built from its REST JSON."""
+    issue = _namespace(raw)
+    issue.raw = raw
+    return issue
+
+
+def _namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{name: _namespace(item) for name, item in value.items()})
+    if isinstance(value, list):
+        return [_namespace(item) for item in value]
+    return value
+
+
+class IssueCache:
+    """Directory of gzip-compressed JSON files, one per issue, with the changelog and comments used by process_issue.
+    An entry stays valid while the 'updated' timestamp of the issue in Jira is the same."""
+
+    def __init__(self, cache_dir, refresh=False, max_age_days=None, max_size_mb=None):
+        self.cache_dir = cache_dir
+        self.refresh = refresh
+        self.max_age_days = max_age_days
+        self.max_size_mb = max_size_mb
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json.gz')
+
+    def get(self, key, updated):
+        """Cached issue, or None if it is missing, outdated or the cache is being refreshed."""
+        if self.refresh:
+            return None
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):  # no entry yet or a damaged file
+            return None
+        if entry.get('updated') != updated:
+            return None
+        os.utime(path)  # eviction removes the least recently used entries first
+        return issue_from_raw(entry['issue'])
+
+    def put(self, issue):
+        raw = issue.raw
+        fields = raw.get('fields', {})
+        entry = {
+            'updated': fields.get('updated'),
+            'issue': {
+                'key': raw['key'],
+                'fields': {name: fields.get(name) for name in CACHED_FIELDS},
+                'changelog': raw.get('changelog'),
+            },
+        }
+        path = self._path(issue.key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)  # other runs never see a half-written entry
+
+    def evict(self):
+        """Remove entries unused for max_age_days, then the least recently used ones until the cache fits in max_size_mb."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json.gz'):
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        expire_before = time.time() - self.max_age_days * 86400 if self.max_age_days else None
+        max_size = self.max_size_mb * 1024 * 1024 if self.max_size_mb else None
+        total_size = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if (expire_before and mtime < expire_before) or (max_size and total_size > max_size):
+                os.remove(path)
+                total_size -= size
+                removed += 1
+        return removed
+
+
+def cached_full_issues(jira, issues, cache, batch_size=100, workers=1):
+    """Full issues for search results that carry only the 'updated' field. Unchanged issues come from the cache,
+    the rest are fetched with bulk 'key in (...)' searches and stored in the cache. Keeps the issue order."""
+    for batch in batched(issues, batch_size):
+        yield from _cached_full_batch(jira, batch, cache, batch_size, workers)
+
+
+def _cached_full_batch(jira, issues, cache, batch_size, workers):
+    full_issues = {}
+    stale_keys = []
+    for issue in issues:
+        cached = cache.get(issue.key, issue.fields.updated)
+        if cached is None:
+            stale_keys.append(issue.key)
+        else:
+            full_issues[issue.key] = cached
+    queries = [f'key in ({", ".join(stale_keys[i:i + batch_size])})' for i in range(0, len(stale_keys), batch_size)]
+    fetched = search_sharded(jira, queries, batch_size, workers, phase='fetch',
+                             fields=','.join(CACHED_FIELDS), expand='changelog')
+    for issue in fetched:
+        issue = fetch_full_issue(jira, issue)
+        cache.put(issue)
+        full_issues[issue.key] = issue
+    # an issue missing from the key search (e.g. moved to another project) is fetched later by process_issue
+    return [full_issues.get(issue.key, issue) for issue in issues]
+
+
+def fetch_full_issue(jira, issue):
+    """Return the issue with full changelog and comments; request it again only if the embedded data is missing or truncated.
+    Without a Jira client (jira is None, offline input) the issue is returned as it is."""
+    if jira is None or (is_fully_expanded(issue) and hasattr(issue.fields, 'summary')):
+        return issue
+    with metrics.phase('fetch'):
+        if isinstance(issue, SimpleNamespace):  # built from raw JSON, stay on the raw path
+            return complete_raw_issue(jira, issue)
+        return call_with_retry(jira.issue, issue.key, expand='changelog')  # получаем историю изменений задачи
+
+
+def complete_raw_issue(jira, issue):
+    """Fetch what Jira truncated in a raw issue through the paginated changelog and comment endpoints.
+    Only the missing list is requested, and comments are paged only up to the last flag or status change:
+    later comments never fall into a blocker interval. The summary is requested too if the issue lacks it
+    (a search hit with only 'updated', e.g. from the --cache-dir search)."""
+    raw = dict(issue.raw)
+    fields = dict(raw.get('fields') or {})
+    if not has_full_changelog(issue):
+        histories, summary = fetch_changelog(jira, issue.key)
+        raw['changelog'] = {'startAt': 0, 'maxResults': len(histories), 'total': len(histories), 'histories': histories}
+        raw = slim_issue_raw(raw)
+        fields = dict(raw['fields'])
+        if summary is not None:
+            fields.setdefault('summary', summary)
+    if 'summary' not in fields:
+        fields['summary'] = call_with_retry(jira._get_json, f'issue/{issue.key}', params={'fields': 'summary'})['fields']['summary']
+    if not has_full_comments(issue):
+        history_times = [parse_jira_time(history['created']) for history in raw['changelog']['histories']]
+        last_needed = as_utc(max(history_times)) if history_times else None
+        comments = []
+        for comment in fetch_pages(jira, f'issue/{issue.key}/comment', 'comments', COMMENT_PAGE_SIZE):
+            comments.append(comment)
+            if last_needed and as_utc(parse_jira_time(comment['created'])) > last_needed:
+                break
+        fields['comment'] = {'startAt': 0, 'maxResults': len(comments), 'total': len(comments), 'comments': comments}
+    raw['fields'] = fields
+    return issue_from_raw(slim_issue_raw(raw))
+
+
+def fetch_changelog(jira, key):
+    """Complete changelog of an issue and its summary, if it came with the changelog (None otherwise).
+    The paginated changelog endpoint exists in Jira Cloud only;
+    Jira Server / Data Center answers 404 there but returns the whole changelog with the issue."""
+    try:
+        return list(fetch_pages(jira, f'issue/{key}/changelog', 'values', CHANGELOG_PAGE_SIZE)), None
+    except Exception as e:
+        if getattr(e, 'status_code', None) != 404:
+            raise
+    raw = call_with_retry(jira._get_json, f'issue/{key}', params={'expand': 'changelog', 'fields': 'summary'})
+    return raw['changelog']['histories'], (raw.get('fields') or {}).get('summary')
+
+
+def fetch_pages(jira, path, list_name, page_size):
+    """Entries of a paginated Jira list endpoint, requested page by page while the consumer iterates."""
+    start_at = 0
+    while True:
+        page = call_with_retry(jira._get_json, path, params={'startAt': start_at, 'maxResults': page_size})
+        entries = page.get(list_name, [])
+        yield from entries
+        start_at += len(entries)
+        if not entries or page.get('isLast') or start_at >= page.get('total', 0):
+            return
+
+
+class JsonStream:
+    """Incremental reader of JSON values from a text file: only the value being decoded is held in memory."""
+
+    def __init__(self, file, buffer_size=INPUT_BUFFER_SIZE):
+        self.file = file
+        self.buffer_size = buffer_size
+        self.buffer = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _read(self):
+        """Append the next part of the file to the unread buffer, False at the end of the file."""
+        data = self.file.read(max(self.buffer_size, len(self.buffer) - self.pos))  # grows with a large value
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return bool(data)
+
+    def peek(self):
+        """Next non-whitespace character, '' at the end of the file."""
+        while True:
+            match = NON_SPACE.search(self.buffer, self.pos)
+            if match:
+                self.pos = match.start()
+                return self.buffer[self.pos]
+            self.pos = len(self.buffer)
+            if not self._read():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Expected {char!r} in the input file, found {self.peek()!r}')
+        self.pos += 1
+
+    def value(self):
+        """Next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._read():
+                    continue
+                raise
+            if end == len(self.buffer) and self._read():  # a number may continue in the next part
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Elements of the next JSON array, one at a time."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+    def issues(self):
+        """Issues from a JSON array of issues, a search response {"issues": [...]} (or several of them)
+        or issues separated by whitespace (NDJSON)."""
+        while first := self.peek():
+            if first == '[':
+                yield from self.array()
+            else:
+                yield from self._object_issues()
+
+    def _object_issues(self):
+        """The 'issues' of a search response one by one; any other object is an issue itself."""
+        self.expect('{')
+        members = {}
+        is_response = False
+        while self.peek() != '}':
+            if members or is_response:
+                self.expect(',')
+            key = self.value()
+            self.expect(':')
+            if key == 'issues':
+                is_response = True
+                yield from self.array()
+            else:
+                members[key] = self.value()
+        self.pos += 1
+        if not is_response:
+            yield members
+
+
+def ndjson_chunks(path, chunk_size=INPUT_CHUNK_SIZE):
+    """(start, end) byte ranges of an NDJSON file of about chunk_size bytes, split at line ends."""
+    if not os.path.getsize(path):
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < len(data):
+            end = data.find(b'\n', min(start + chunk_size, len(data)) - 1)
+            end = len(data) if end < 0 else end + 1
+            yield start, end
+            start = end
+
+
+def parse_ndjson_chunk(path, chunk):
+    """Slimmed raw issues from the lines of an NDJSON file in the byte range chunk, read through mmap."""
+    start, end = chunk
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        data.seek(start)
+        issues = []
+        while data.tell() < end:
+            line = data.readline()
+            if line.strip():
+                issues.append(slim_issue_raw(json.loads(line)))
+        return issues
+
+
+def read_issue_file(path, workers=1):
+    """Raw issues with changelog and comments from a Jira JSON export or NDJSON dump, without loading the whole file.
+    NDJSON files (.ndjson, .jsonl) are split into chunks parsed by up to workers processes, in file order."""
+    if path.lower().endswith(NDJSON_EXTENSIONS):
+        from concurrent.futures import ProcessPoolExecutor  # multiprocessing is a noticeable part of the startup time
+        parse = partial(parse_ndjson_chunk, path)
+        for issues in ordered_map(parse, ndjson_chunks(path), workers, ProcessPoolExecutor):
+            yield from issues
+    else:
+        with open(path, encoding='utf-8-sig') as f:
+            for raw in JsonStream(f).issues():
+                yield slim_issue_raw(raw)
+
+
+def offline_issues(path, workers=1):
+    """Issues from read_issue_file for process_issue(None, issue); an issue exported without summary, changelog
+    or comments gets empty ones, truncated lists are analysed as they are."""
+    for raw in read_issue_file(path, workers):
+        raw.setdefault('changelog', {'startAt': 0, 'maxResults': 0, 'total': 0, 'histories': []})
+        raw['fields'].setdefault('summary', '')
+        raw['fields'].setdefault('comment', {'startAt': 0, 'maxResults': 0, 'total': 0, 'comments': []})
+        yield issue_from_raw(raw)
+
+
+def process_issue(jira, issue):
+    issue = fetch_full_issue(jira, issue)
+    with metrics.phase('extract'):
+        blockers, _ = extract_blockers(issue)
+        return blockers
+
+
+def extract_blockers(issue):
+    """Blockers of an issue with its full changelog and comments, and the set time of the flag the issue is
+    blocked by now (None if it is not). The reports and BlockerService share this split of a flag still set."""
+    cycles, flag_set_time, status_change_times = flag_cycles(issue)
+    comments = CommentIndex(issue.fields.comment.comments)  # shared by all blockers of the issue
+    blocker_infos = [make_blocker_record(issue, flag_set, flag_removed, comments, False) for flag_set, flag_removed in cycles]
+
+    # If the flag is still set at the end of history, use the last status change time as the flag removed time.
+    # Without a status change after the flag was set there is no end to measure, the issue is still blocked
+    if flag_set_time and status_change_times and status_change_times[-1] > flag_set_time:
+        flag_removed_time = status_change_times[-1]  # Use the last status change time
+        blocker_info = make_blocker_record(issue, flag_set_time, flag_removed_time, comments, True)
+        blocker_infos.append(blocker_info)
+        flag_set_time = None
+
+    if working_calendar is not None and blocker_infos:
+        working_calendar.apply(blocker_infos)  # one vectorized call for all blockers of the issue
+
+    return blocker_infos, flag_set_time
+
+
+def flag_cycles(issue):
+    """Flag cycles in the changelog of an issue: (flag set time, flag removed time) of the completed cycles,
+    the set time of a flag still set at the end of the history (None if there is none) and the status change times."""
+    flag_set_time = None
+    flag_removed_time = None
+    status_change_times = []
+    cycles = []
+
+    for history in issue.changelog.histories:
+        history_created_time = parse_jira_time(history.created)
+        for item in history.items:
+            if item.field == 'status':
+                status_change_times.append(history_created_time)
+            if item.field == 'Flagged':
+                if item.toString == 'Impediment':
+                    flag_set_time = history_created_time
+                elif item.fromString == 'Impediment':
+                    flag_removed_time = history_created_time
+
+            # Если установлены и время установки, и время снятия флага, выводим информацию о блокировке и сбрасываем переменные
+            if flag_set_time and flag_removed_time:
+                cycles.append((flag_set_time, flag_removed_time))
+                flag_set_time = None
+                flag_removed_time = None
+
+    return cycles, flag_set_time, status_change_times
+
+def process_issues(jira, issues, workers=1):
+    """Process issues on a pool of worker threads sharing one Jira client. Yields blocker lists in issue order."""
+    yield from ordered_map(partial(process_issue, jira), issues, workers)
+
+class BlockerRecord:
+    """One blocker. Keeps the raw flag times, blocked seconds, category and a reference to the issue's comment index;
+    time strings and the comments text are produced only when read, e.g. by a writer.
+    record['Flag Set Time'] and to_dict() give the values of the former per-blocker dict."""
+    __slots__ = ('issue_key', 'issue_summary', 'flag_set_time', 'flag_removed_time', 'seconds', 'category',
+                 'comments', 'flag_was_not_removed', 'working_seconds', 'project', 'team')
+
+    def __init__(self, issue_key, issue_summary, flag_set_time, flag_removed_time, seconds, category, comments,
+                 flag_was_not_removed):
+        self.issue_key = issue_key
+        self.issue_summary = issue_summary
+        self.flag_set_time = flag_set_time
+        self.flag_removed_time = flag_removed_time
+        self.seconds = seconds
+        self.category = category
+        self.comments = comments
+        self.flag_was_not_removed = flag_was_not_removed
+        self.working_seconds = None  # set by WorkingCalendar.apply
+        self.project = None  # of the target the issue was found by
+        self.team = None
+
+    def __getitem__(self, name):
+        return BLOCKER_FIELDS[name](self)
+
+    def keys(self):
+        return BLOCKER_FIELDS.keys()
+
+    def to_dict(self):
+        return {name: get(self) for name, get in BLOCKER_FIELDS.items()}
+
+    def __repr__(self):
+        return f'BlockerRecord({self.issue_key}, {self.flag_set_time:%Y-%m-%d %H:%M}, {self.seconds}s)'
+
+
+# Field name in the output -> how it is read from a BlockerRecord
+BLOCKER_FIELDS = {
+    'Issue Key': attrgetter('issue_key'),
+    'Issue Summary': attrgetter('issue_summary'),
+    'Flag Set Time': lambda record: record.flag_set_time.strftime('%Y-%m-%d %H:%M'),
+    'Flag Removed Time': lambda record: record.flag_removed_time.strftime('%Y-%m-%d %H:%M'),
+    'Time Blocked': attrgetter('seconds'),  # always in seconds
+    'Blocker Category': attrgetter('category'),
+    'Comments': lambda record: comments_text(record.comments, record.flag_set_time, record.flag_removed_time),
+    'Flag was not removed': attrgetter('flag_was_not_removed'),
+}
+
+
+def make_blocker_record(issue, flag_set_time, flag_removed_time, comments, flag_was_not_removed):
+    comments = comment_index(comments)
+    time_flagged = flag_removed_time - flag_set_time
+    return BlockerRecord(
+        issue.key,
+        issue.fields.summary,
+        flag_set_time,
+        flag_removed_time,
+        time_flagged.total_seconds(),
+        blocker_category_from_comment(comments, flag_set_time, category_pattern,
+                                      flag_removed_time if category_in_interval else None),
+        comments,
+        flag_was_not_removed,
+    )
+
+
+def blocker_to_json(blocker):
+    """JSON-serialisable form of a blocker for the journal, with only the comments of the blocked interval."""
+    start, end = as_utc(blocker.flag_set_time), as_utc(blocker.flag_removed_time)
+    comments = [{'created': c.created, 'body': c.body} for c in blocker.comments.comments
+                if start <= as_utc(parse_jira_time(c.created)) <= end]
+    return {
+        'issue_key': blocker.issue_key,
+        'issue_summary': blocker.issue_summary,
+        'flag_set_time': blocker.flag_set_time.isoformat(),
+        'flag_removed_time': blocker.flag_removed_time.isoformat(),
+        'seconds': blocker.seconds,
+        'category': blocker.category,
+        'comments': comments,
+        'flag_was_not_removed': blocker.flag_was_not_removed,
+        'working_seconds': blocker.working_seconds,
+        'project': blocker.project,
+        'team': blocker.team,
+    }
+
+
+def blocker_from_json(data):
+    """BlockerRecord saved with blocker_to_json."""
+    blocker = BlockerRecord(
+        data['issue_key'],
+        data['issue_summary'],
+        parse_jira_time(data['flag_set_time']),
+        parse_jira_time(data['flag_removed_time']),
+        data['seconds'],
+        data['category'],
+        CommentIndex([SimpleNamespace(**comment) for comment in data['comments']]),
+        data['flag_was_not_removed'],
+    )
+    blocker.working_seconds = data['working_seconds']
+    blocker.project = data['project']
+    blocker.team = data['team']
+    return blocker
+
+
+class Journal:
+    """Append-only NDJSON checkpoint of a run: one line per processed issue with its target, key and blockers.
+    A line is written with a single os.write to a file opened with O_APPEND, so a crash leaves at most one
+    incomplete line at the end, which is dropped on resume. Lines are fsynced every JOURNAL_SYNC_EVERY issues."""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done = self.load() if resume else {}
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | (0 if resume else os.O_TRUNC), 0o644)
+        self.unsynced = 0
+
+    def load(self):
+        """Blockers of the journaled issues by (target name, issue key); the file is cut after the last complete line."""
+        done = {}
+        complete = 0
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return done
+        with f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                done[(entry['target'], entry['key'])] = [blocker_from_json(data) for data in entry['blockers']]
+                complete += len(line)
+        os.truncate(self.path, complete)
+        return done
+
+    def record(self, target, key, blockers):
+        line = json.dumps({'target': target.name, 'key': key, 'blockers': [blocker_to_json(b) for b in blockers]},
+                          ensure_ascii=False)
+        data = (line + '\n').encode('utf-8')
+        while data:
+            data = data[os.write(self.fd, data):]
+        self.unsynced += 1
+        if self.unsynced >= JOURNAL_SYNC_EVERY:
+            os.fsync(self.fd)
+            self.unsynced = 0
+
+    def close(self):
+        os.fsync(self.fd)
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def merge_journal(pairs, done, process):
+    """(target, issue key, blockers, journaled) for the (target, issue) pairs in their order: blockers of issues
+    in done (by target name and key) are taken from it, the other issues go through process, an order-keeping
+    stream function over (target, issue) pairs that yields (target, blockers)."""
+    order = deque()  # (target, key, journaled blockers or None for a processed issue)
+
+    def todo():
+        for target, issue in pairs:
+            blockers = done.get((target.name, issue.key))
+            order.append((target, issue.key, blockers))
+            if blockers is None:
+                yield target, issue
+
+    for target, blockers in process(todo()):
+        while order[0][2] is not None:
+            yield order.popleft() + (True,)
+        _, key, _ = order.popleft()
+        yield target, key, blockers, False
+    while order:
+        yield order.popleft() + (True,)
+
+
+class WorkingCalendar:
+    """Working hours on business days (Monday to Friday by default, minus holidays) for blocked working time.
+    Built on a numpy busdaycalendar, so business days between two dates are counted without stepping
+    through them, for a whole array of blockers at once. Times are taken as the wall time Jira returned."""
+
+    def __init__(self, holidays=(), start_hour=9, end_hour=18, weekmask='1111100'):
+        import numpy as np
+        self.np = np
+        self.calendar = np.busdaycalendar(weekmask=weekmask, holidays=[str(day) for day in holidays])
+        self.day_start = start_hour * 3600
+        self.day_end = end_hour * 3600
+
+    def working_seconds(self, starts, ends):
+        """Working seconds in each [start, end) interval, as a float array."""
+        np = self.np
+        starts = np.array([moment.replace(tzinfo=None) for moment in starts], dtype='datetime64[s]')
+        ends = np.array([moment.replace(tzinfo=None) for moment in ends], dtype='datetime64[s]')
+        start_days = starts.astype('datetime64[D]')
+        end_days = ends.astype('datetime64[D]')
+        start_seconds = (starts - start_days).astype(np.int64)  # seconds since midnight
+        end_seconds = (ends - end_days).astype(np.int64)
+        same_day = start_days == end_days
+
+        def working_part(since, until):
+            return np.maximum(0, np.minimum(until, self.day_end) - np.maximum(since, self.day_start))
+
+        first_day = working_part(start_seconds, np.where(same_day, end_seconds, 86400))
+        first_day = first_day * np.is_busday(start_days, busdaycal=self.calendar)
+        last_day = np.where(same_day, 0, working_part(0, end_seconds) * np.is_busday(end_days, busdaycal=self.calendar))
+        full_days = np.where(same_day, 0, np.busday_count(start_days + 1, end_days, busdaycal=self.calendar))
+        total = first_day + last_day + full_days * (self.day_end - self.day_start)
+        return np.where(ends > starts, total, 0).astype(float)
+
+    def apply(self, blockers):
+        """Set working_seconds of the blockers."""
+        seconds = self.working_seconds([b.flag_set_time for b in blockers], [b.flag_removed_time for b in blockers])
+        for blocker, value in zip(blockers, seconds.tolist()):
+            blocker.working_seconds = value
+
+
+def load_holidays(path):
+    """Dates from a holiday file: one YYYY-MM-DD date per line, text after the date and lines starting with # are ignored."""
+    holidays = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                holidays.append(datetime.strptime(line.split()[0], '%Y-%m-%d').date())
+    return holidays
+
+
+def blocker_info_to_dict(issue, flag_set_time, flag_removed_time, comments, flag_was_not_removed):
+    return make_blocker_record(issue, flag_set_time, flag_removed_time, comments, flag_was_not_removed).to_dict()
+
+
+@lru_cache(maxsize=65536)
+def parse_jira_time(value):
+    """Parse a Jira timestamp such as '2024-01-15T10:00:00.000+0000'. Several times faster than strptime;
+    repeated values (a comment and the flag change it was posted with) are taken from the cache."""
+    if len(value) > 5 and value[-5] in '+-' and value[-3] != ':':
+        value = f'{value[:-2]}:{value[-2:]}'  # '+0000' -> '+00:00', older fromisoformat accepts only this form
+    return datetime.fromisoformat(value)
+
+
+def as_utc(moment):
+    """Timezone-aware time in UTC; a naive time is taken as UTC."""
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def to_second(moment):
+    """UTC time truncated to seconds, to match a comment with the flag change saved with it a few ms apart."""
+    return as_utc(moment).replace(microsecond=0)
+
+
+class CommentIndex:
+    """Comments of one issue, indexed by creation time. Timestamps are parsed once per issue, not once per blocker:
+    bodies sorted by time for range queries with bisect, and bodies grouped by time for exact lookups."""
+
+    def __init__(self, comments):
+        self.comments = list(comments)
+        self._times = None
+        self._sorted = None
+        self._bodies = None
+        self._by_time = None
+
+    def between(self, start, end):
+        """Bodies of comments created in [start, end], in time order."""
+        interval = self._range(start, end)
+        return self._bodies[interval]
+
+    def comments_between(self, start, end):
+        """Comments created in [start, end], in time order."""
+        interval = self._range(start, end)
+        return self._sorted[interval]
+
+    def _range(self, start, end):
+        if self._times is None:
+            parsed = sorted(((as_utc(parse_jira_time(c.created)), c) for c in self.comments), key=lambda pair: pair[0])
+            self._times = [comment_time for comment_time, _ in parsed]
+            self._sorted = [c for _, c in parsed]
+            self._bodies = [c.body for c in self._sorted]
+        return slice(bisect_left(self._times, as_utc(start)), bisect_right(self._times, as_utc(end)))
+
+    def at(self, comment_time):
+        """Bodies of comments created in the same second as comment_time, in their original order."""
+        return [c.body for c in self.comments_at(comment_time)]
+
+    def comments_at(self, comment_time):
+        """Comments created in the same second as comment_time, in their original order."""
+        if self._by_time is None:
+            self._by_time = {}
+            for c in self.comments:
+                self._by_time.setdefault(to_second(parse_jira_time(c.created)), []).append(c)
+        return self._by_time.get(to_second(comment_time), [])
+
+
+def comment_index(comments):
+    """CommentIndex for a list of comments; an existing index is reused."""
+    return comments if isinstance(comments, CommentIndex) else CommentIndex(comments)
+
+
+class CategoryRules:
+    """Blocker category classifier compiled into one regular expression, so a comment is scanned once whatever the
+    number of rules: an alternation with a named group per (category, pattern) rule, in priority order, followed by
+    one group for the keywords of all rules ({keyword: category}, case-insensitive whole words) shaped as a trie.
+    If every alternative starts with a known character, a lookahead on these characters lets the scan skip the other
+    positions without trying the alternatives, much like an Aho-Corasick automaton would.
+    The first match in the comment decides; at the same position the rule listed first wins. A rule without
+    a category takes the matched text as the category, as --category-pattern does.
+    Results are memoised per comment id (invalidated if the comment body changes)."""
+
+    def __init__(self, rules, keywords=None):
+        rules = list(rules)
+        self.keywords = {keyword.lower(): category for keyword, category in (keywords or {}).items()}
+        if len(rules) == 1 and not self.keywords:
+            self.regex = re.compile(rules[0][1])  # the pattern as given, its own inline flags are allowed
+        else:
+            groups = [(first_char(pattern), f'(?P<_rule{number}>{pattern})') for number, (_, pattern) in enumerate(rules)]
+            if self.keywords:
+                keyword_chars = {case for keyword in self.keywords for case in (keyword[0].lower(), keyword[0].upper())}
+                groups.append((keyword_chars, rf'(?P<_keywords>(?<!\w)(?i:{trie_pattern(self.keywords)})(?!\w))'))
+            if any(char is None for char, _ in groups):
+                self.regex = re.compile('|'.join(group for _, group in groups))
+            else:
+                # rules with different first characters never match at the same position, so grouping them by
+                # the first character keeps the priority order; a position is tested against one lookahead per group
+                by_char = {}
+                for char, group in groups:
+                    by_char.setdefault(char if isinstance(char, str) else frozenset(char), []).append(group)
+                chars = lambda char: ''.join(re.escape(c) for c in sorted(char))
+                self.regex = re.compile('(?=[{}])(?:{})'.format(
+                    chars({c for char in by_char for c in char}),
+                    '|'.join(f'(?=[{chars(char)}])(?:{"|".join(members)})' for char, members in by_char.items())))
+        self.categories = [category for category, _ in rules]
+        self.memo = {}
+
+    def classify(self, text):
+        """Category of a text, '' if no rule matches."""
+        match = self.regex.search(text)
+        if not match:
+            return ''
+        if len(self.categories) == 1 and not self.keywords:
+            category = self.categories[0]  # compiled as given, lastgroup may be a group of the pattern itself
+        elif match.lastgroup == '_keywords':
+            category = self.keywords[match.group(0).lower()]
+        else:
+            category = self.categories[int(match.lastgroup[5:])]
+        return match.group(0) if category is None else category
+
+    def comment_category(self, comment):
+        comment_id = getattr(comment, 'id', None)
+        if comment_id is None:
+            return self.classify(comment.body)
+        body_hash = hash(comment.body)
+        cached = self.memo.get(comment_id)
+        if cached is not None and cached[0] == body_hash:
+            return cached[1]
+        if len(self.memo) >= CATEGORY_MEMO_SIZE:
+            self.memo.clear()
+        category = self.classify(comment.body)
+        self.memo[comment_id] = (body_hash, category)
+        return category
+
+
+def first_char(pattern):
+    """The character every match of a pattern starts with, if the pattern starts with a plain or escaped literal
+    that is not optional; None otherwise (the analysis is deliberately simple)."""
+    if '|' in pattern:
+        return None
+    if pattern[:1] == '\\' and pattern[1:2] and not pattern[1].isalnum():
+        char, rest = pattern[1], pattern[2:]
+    elif pattern[:1] and pattern[0] not in '.^$*+?{}[]\\|()':
+        char, rest = pattern[0], pattern[1:]
+    else:
+        return None
+    return None if rest[:1] in ('*', '?', '{') else char
+
+
+def trie_pattern(words):
+    """Regular expression matching any of the words, with common prefixes factored out: (?:ab(?:c|d)) for abc, abd.
+    Python's re tries alternatives one by one, so a flat alternation of many words is slow."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}  # end of a word
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:  # a word ends here, the rest is optional
+            pattern = (f'(?:{pattern})' if len(branches) == 1 else pattern) + '?'
+        return pattern
+
+    return build(trie)
+
+
+@lru_cache(maxsize=16)
+def pattern_rules(pattern):
+    """CategoryRules of a single --category-pattern, compiled once."""
+    return CategoryRules([(None, pattern)])
+
+
+def category_rules(category_search_pattern):
+    """CategoryRules for a pattern string or the rules themselves."""
+    if isinstance(category_search_pattern, CategoryRules):
+        return category_search_pattern
+    return pattern_rules(category_search_pattern)
+
+
+def load_category_rules(path):
+    """CategoryRules from a YAML rules file: a list of mappings with category, pattern, patterns and keywords keys,
+    or a mapping with such a list under 'rules'. Requires PyYAML."""
+    import yaml
+    with open(path, encoding='utf-8') as f:
+        entries = yaml.safe_load(f) or []
+    if isinstance(entries, dict):
+        entries = entries.get('rules') or []
+    rules = []
+    keywords = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.keys() <= RULE_KEYS or not entry.keys() & (RULE_KEYS - {'category'}):
+            raise ValueError(f'Category rules in {path} must be mappings with a pattern, patterns or keywords '
+                             f'and an optional category: {entry!r}')
+        category = entry.get('category')
+        patterns = list(entry.get('patterns') or []) + ([entry['pattern']] if entry.get('pattern') else [])
+        rules.extend((category, str(pattern)) for pattern in patterns)
+        for keyword in entry.get('keywords') or []:
+            keywords.setdefault(str(keyword).lower(), category)  # the first rule with a keyword wins
+    if not rules and not keywords:
+        raise ValueError(f'No category rules in {path}, give at least one pattern or keyword')
+    for _, pattern in rules:
+        error = rule_pattern_error(pattern, combined=len(rules) > 1 or bool(keywords))
+        if error:
+            raise ValueError(f'Category rule pattern {pattern!r} in {path}: {error}')
+    try:
+        return CategoryRules(rules, keywords)
+    except re.error as e:  # the rules are valid one by one, e.g. a group name is used in several of them
+        raise ValueError(f'Category rules in {path} cannot be combined into one regular expression ({e}), '
+                         f'give the named groups of different rules different names') from None
+
+
+def rule_pattern_error(pattern, combined=True):
+    """Why a pattern cannot be a rule of CategoryRules, None if it can. Combined with other rules into one
+    regular expression, each rule is a named group: numbered group references would point to the groups of
+    other rules, and inline flags of the whole pattern would apply to every rule."""
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        return f'not a regular expression ({e})'
+    if not combined:
+        return None
+    unescaped = r'(?<!\\)(?:\\\\)*'  # preceded by an even number of backslashes
+    if re.search(unescaped + r'(?:\\[1-9]|\(\?\(\d)', pattern):
+        return 'numbered group references do not work next to other rules, use named groups: (?P<q>...)...(?P=q)'
+    if re.search(unescaped + r'\(\?[aiLmsux]+\)', pattern):
+        return 'inline flags would apply to all rules, scope them to the pattern: (?i:...)'
+    return None
+
+
+def blocker_category_from_comment(comments, flag_set_time, category_search_pattern, flag_removed_time=None):
+    """Category from the comments added with the flag; if they have none and flag_removed_time is given,
+    from the first comment of the blocked interval that has one."""
+#    category_search_pattern = r"#\w+"  # слово, начинающееся с #
+#    category_search_pattern =  r'\{(.+?)\} # текст в фигурных скобках, {blocker+category}
+    rules = category_rules(category_search_pattern)
+    comments = comment_index(comments)
+    for comment in comments.comments_at(flag_set_time):
+        category = rules.comment_category(comment)
+        if category:
+            return category
+    if flag_removed_time is not None:
+        for comment in comments.comments_between(flag_set_time, flag_removed_time):
+            category = rules.comment_category(comment)
+            if category:
+                return category
+    return ""
+
+def comments_text(comments, flag_set_time, flag_removed_time):
+    return ''.join(body + '\n---\n' for body in comment_index(comments).between(flag_set_time, flag_removed_time))
+
+
+def format_blocking_time(seconds, time_unit):
+    """Convert seconds to display value in days or hours. Returns (value, unit_str)."""
+    if time_unit == 'hours':
+        return round(seconds / 3600, 1), 'hours'
+    return round(seconds / 86400, 1), 'days'
+
+
+class BlockerWriter:
+    """Output for one --mode. Blockers are written one by one as soon as their issue is processed."""
+    progress = True  # show the progress line while issues are processed
+
+    def __init__(self, output_file, time_unit):
+        self.output_file = output_file
+        self.time_unit = time_unit
+        self.now = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        self.working_time = working_calendar is not None
+        self.target_columns = target_columns
+
+    def write(self, blocker):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        with metrics.phase('write'):
+            self.close()
+
+    def display_row(self, blocker):
+        """Output fields of a blocker, formatted now, with Time Blocked in --time-unit."""
+        row = blocker.to_dict()
+        row['Time Blocked'], row['Time Unit'] = format_blocking_time(blocker.seconds, self.time_unit)
+        if self.working_time:
+            row[WORKING_TIME] = format_blocking_time(blocker.working_seconds, self.time_unit)[0]
+        if self.target_columns:
+            row['Project'] = blocker.project or ''
+            row['Team'] = blocker.team or ''
+        return row
+
+    def output_columns(self, columns):
+        """Output columns with Project and Team first in runs over several targets,
+        and Working Time Blocked after Time Blocked if --calendar working-hours is used."""
+        columns = list(columns)
+        if self.working_time:
+            position = columns.index('Time Blocked') + 1
+            columns[position:position] = [WORKING_TIME]
+        return (TARGET_COLUMNS if self.target_columns else []) + columns
+
+
+class PrintWriter(BlockerWriter):
+    progress = False
+
+    def write(self, blocker):
+        display_value, unit_str = format_blocking_time(blocker.seconds, self.time_unit)
+        print(f"\n>>> Issue: {blocker['Issue Key']} - {blocker['Issue Summary']} <<<\n")
+        if self.target_columns:
+            print(f"Project: {blocker.project or ''}, team: {blocker.team or ''}\n")
+        print(f"Block set:     {blocker['Flag Set Time']}")
+        print(f"Block removed: {blocker['Flag Removed Time']}\n")
+        if blocker['Flag was not removed']:
+            print("Flag was not removed!!! First status change after flag set considered as blocker removed\n")
+        print(f"Time blocked ({unit_str}): {display_value}")
+        if self.working_time:
+            print(f"Working time blocked ({unit_str}): {format_blocking_time(blocker.working_seconds, self.time_unit)[0]}")
+        print("=======\n")
+        if blocker['Blocker Category']:
+            print(f"Blocker category: {blocker['Blocker Category']}\n______")
+        print(f"Comment: \n{blocker['Comments']}\n", flush=True)
+
+
+class CsvWriter(BlockerWriter):
+    fieldnames = ['Issue Key', 'Issue Summary', 'Flag Set Time', 'Flag Removed Time', 'Time Blocked', 'Time Unit', 'Blocker Category', 'Comments', 'Flag was not removed']
+
+    def __init__(self, output_file, time_unit):
+        super().__init__(output_file, time_unit)
+        self.csvfile = open(f"{output_file}-{self.now.replace(':', '-')}.csv", "w", newline="")
+        self.writer = csv.DictWriter(self.csvfile, fieldnames=self.output_columns(self.fieldnames))
+        self.writer.writeheader()
+        self.rows = 0
+
+    def write(self, blocker):
+        self.writer.writerow(self.display_row(blocker))
+        self.rows += 1
+        if self.rows % FLUSH_EVERY == 0:
+            self.csvfile.flush()  # a crashed run still leaves the rows written so far
+
+    def close(self):
+        self.csvfile.close()
+
+
+class XlsxWriter(BlockerWriter):
+    """Excel workbook in openpyxl write-only mode: rows are streamed to the file instead of being collected in a DataFrame."""
+    columns = ['Issue Key', 'Issue Summary', 'Flag Set Time', 'Flag Removed Time', 'Time Blocked', 'Blocker Category', 'Comments', 'Flag was not removed', 'Time Unit']
+
+    def __init__(self, output_file, time_unit):
+        super().__init__(output_file, time_unit)
+        from openpyxl import Workbook
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Sheet1')
+        self.columns = self.output_columns(self.columns)
+        self.sheet.append(self.columns)
+
+    def write(self, blocker):
+        row = self.display_row(blocker)
+        self.sheet.append([row[name] for name in self.columns])
+
+    def close(self):
+        self.workbook.save(f'{self.output_file}-{self.now}.xlsx')
+
+
+class ArrowWriter(BlockerWriter):
+    """Typed columnar output for notebooks, written in batches of ROW_GROUP_SIZE blockers: flag times as timestamps,
+    Time Blocked as float seconds (--time-unit is not applied), Blocker Category as a categorical, Flag was not removed as bool."""
+    extension = None
+
+    def __init__(self, output_file, time_unit):
+        super().__init__(output_file, time_unit)
+        import pyarrow as pa
+        self.pa = pa
+        types = {
+            'Project': pa.string(),
+            'Team': pa.string(),
+            'Issue Key': pa.string(),
+            'Issue Summary': pa.string(),
+            'Flag Set Time': pa.timestamp('ms'),
+            'Flag Removed Time': pa.timestamp('ms'),
+            'Time Blocked': pa.float64(),
+            WORKING_TIME: pa.float64(),
+            'Blocker Category': pa.dictionary(pa.int32(), pa.string()),
+            'Comments': pa.string(),
+            'Flag was not removed': pa.bool_(),
+        }
+        columns = self.output_columns([name for name in types if name not in TARGET_COLUMNS and name != WORKING_TIME])
+        self.schema = pa.schema([(name, types[name]) for name in columns])
+        self.path = f"{output_file}-{self.now.replace(':', '-')}.{self.extension}"
+        self.writer = self.open_writer()
+        # the category dictionary only grows, so every batch extends the dictionary of the previous one
+        self.categories = []
+        self.category_codes = {}
+        self._new_batch()
+
+    def open_writer(self):
+        raise NotImplementedError
+
+    def _new_batch(self):
+        self.columns = {name: [] for name in self.schema.names}
+
+    def write(self, blocker):
+        category = blocker.category
+        if category not in self.category_codes:
+            self.category_codes[category] = len(self.categories)
+            self.categories.append(category)
+        if self.target_columns:
+            self.columns['Project'].append(blocker.project)
+            self.columns['Team'].append(blocker.team)
+        self.columns['Issue Key'].append(blocker.issue_key)
+        self.columns['Issue Summary'].append(blocker.issue_summary)
+        # wall time as shown in Jira, like the text outputs
+        self.columns['Flag Set Time'].append(blocker.flag_set_time.replace(tzinfo=None))
+        self.columns['Flag Removed Time'].append(blocker.flag_removed_time.replace(tzinfo=None))
+        self.columns['Time Blocked'].append(float(blocker.seconds))
+        if self.working_time:
+            self.columns[WORKING_TIME].append(blocker.working_seconds)
+        self.columns['Blocker Category'].append(self.category_codes[category])
+        self.columns['Comments'].append(blocker['Comments'])
+        self.columns['Flag was not removed'].append(bool(blocker.flag_was_not_removed))
+        if len(self.columns['Issue Key']) >= ROW_GROUP_SIZE:
+            self._write_batch()
+
+    def _write_batch(self):
+        pa = self.pa
+        arrays = []
+        for field in self.schema:
+            values = self.columns[field.name]
+            if field.name == 'Blocker Category':
+                arrays.append(pa.DictionaryArray.from_arrays(pa.array(values, pa.int32()), pa.array(self.categories, pa.string())))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._new_batch()
+
+    def close(self):
+        if self.columns['Issue Key']:
+            self._write_batch()
+        self.writer.close()
+
+
+class ParquetWriter(ArrowWriter):
+    extension = 'parquet'
+
+    def open_writer(self):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self.path, self.schema)
+
+
+class FeatherWriter(ArrowWriter):
+    extension = 'feather'
+
+    def open_writer(self):
+        import pyarrow.ipc as ipc
+        # Feather v2 is the Arrow IPC file format; a growing dictionary is written as deltas
+        return ipc.new_file(self.path, self.schema, options=ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+
+class SummaryWriter(BlockerWriter):
+    """Aggregated report instead of single blockers. Only the columns needed for aggregation are collected."""
+    progress = True
+
+    def __init__(self, output_file, time_unit, top=10):
+        super().__init__(output_file, time_unit)
+        self.top = top
+        self.columns = {'Issue Key': [], 'Issue Summary': [], 'Blocker Category': [], 'Time Blocked': [], 'Flag was not removed': []}
+
+    def write(self, blocker):
+        self.columns['Issue Key'].append(blocker.issue_key)
+        self.columns['Issue Summary'].append(blocker.issue_summary)
+        self.columns['Blocker Category'].append(blocker.category or NO_CATEGORY)
+        self.columns['Time Blocked'].append(blocker.seconds)
+        self.columns['Flag was not removed'].append(blocker.flag_was_not_removed)
+
+    def close(self):
+        import pandas as pd
+        frame = pd.DataFrame(self.columns)
+        frame['Blocker Category'] = frame['Blocker Category'].astype('category')
+        if frame.empty:
+            print('\nNo blockers to summarize')
+            return
+        summary = summarize_blockers(frame, self.time_unit, self.top)
+        unit = summary['unit']
+        print(f"\n>>> Blocked time per category ({unit}) <<<\n")
+        print(summary['by_category'].to_string())
+        print(f"\n>>> Top {self.top} blocking issues ({unit}) <<<\n")
+        print(summary['top_issues'].to_string())
+        print(f"\n>>> Flag was not removed: {summary['not_removed_share']:.1%} of blockers <<<\n")
+        print(">>> Blocked time histogram <<<\n")
+        print(summary['histogram'].to_string())
+
+
+def summarize_blockers(frame, time_unit, top=10):
+    """Aggregates of a blockers table with 'Issue Key', 'Issue Summary', 'Blocker Category', 'Time Blocked' (seconds)
+    and 'Flag was not removed' columns. All aggregation is vectorized group-bys on seconds;
+    format_blocking_time is applied only to the resulting aggregates."""
+    import numpy as np
+    import pandas as pd
+
+    def display(values):
+        return values.map(lambda seconds: format_blocking_time(seconds, time_unit)[0])
+
+    grouped = frame.groupby('Blocker Category', observed=True)['Time Blocked']
+    by_category = grouped.agg(['count', 'sum', 'mean', 'median'])
+    by_category.columns = ['Blockers', 'Total', 'Mean', 'Median']
+    by_category[['P85', 'P95']] = grouped.quantile([0.85, 0.95]).unstack()
+    by_category = by_category.sort_values('Total', ascending=False)
+    by_category[TIME_COLUMNS] = by_category[TIME_COLUMNS].apply(display)
+
+    top_issues = (frame.groupby(['Issue Key', 'Issue Summary'], observed=True)['Time Blocked']
+                  .agg(['count', 'sum']).nlargest(top, 'sum'))
+    top_issues.columns = ['Blockers', 'Total']
+    top_issues['Total'] = display(top_issues['Total'])
+
+    counts, _ = np.histogram(frame['Time Blocked'].to_numpy(), bins=HISTOGRAM_EDGES)
+    histogram = pd.Series(counts, index=pd.Index(HISTOGRAM_LABELS, name='Time Blocked'), name='Blockers')
+
+    return {
+        'by_category': by_category,
+        'top_issues': top_issues,
+        'not_removed_share': float(frame['Flag was not removed'].mean()),
+        'histogram': histogram,
+        'unit': format_blocking_time(0, time_unit)[1],
+    }
+
+
+def blocked_timeline(intervals, step):
+    """Sweep line over blocker intervals [(flag set time, flag removed time, category)], O(n log n) for the sort.
+    Returns a dict with:
+      periods       - start of every step-long period from the first flag set to the last removal,
+      series        - {category: [maximum number of blockers of the category open at the same time in each period]},
+      totals        - the same over all categories,
+      peak          - the highest number of blockers open at the same time,
+      peak_windows  - [start, end) windows during which that many blockers were open."""
+    events = []
+    for start, end, category in intervals:
+        start, end = as_utc(start), as_utc(end)
+        if end > start:
+            events.append((start, 1, category))
+            events.append((end, -1, category))
+    events.sort(key=lambda event: (event[0], event[1]))  # a blocker removed when another is set is not concurrent with it
+    categories = sorted({category for _, _, category in intervals})
+    result = {'periods': [], 'series': {category: [] for category in categories}, 'totals': [], 'peak': 0, 'peak_windows': []}
+    if not events:
+        return result
+
+    first = events[0][0]
+    period_start = first.replace(minute=0, second=0, microsecond=0)
+    if step >= timedelta(days=1):
+        period_start = period_start.replace(hour=0)
+    open_now = dict.fromkeys(categories, 0)
+    total = 0
+    period_peak = dict(open_now)
+    period_total_peak = 0
+    peak_windows = result['peak_windows']
+
+    def close_period():
+        result['periods'].append(period_start)
+        for category in categories:
+            result['series'][category].append(period_peak[category])
+        result['totals'].append(period_total_peak)
+
+    for moment, delta, category in events:
+        while moment >= period_start + step:
+            close_period()
+            period_start += step
+            period_peak = dict(open_now)
+            period_total_peak = total
+        if delta < 0 and total == result['peak']:
+            peak_windows[-1][1] = moment
+        open_now[category] += delta
+        total += delta
+        if delta < 0 and moment == period_start:
+            # removed right at the start of the period: not open in it, while the peaks were seeded with it;
+            # removals are sorted before the flags set at the same moment, so nothing else was counted yet
+            period_peak[category] = open_now[category]
+            period_total_peak = total
+        if delta > 0:
+            period_peak[category] = max(period_peak[category], open_now[category])
+            period_total_peak = max(period_total_peak, total)
+            if total > result['peak']:
+                result['peak'] = total
+                peak_windows[:] = [[moment, None]]
+            elif total == result['peak']:
+                if peak_windows[-1][1] == moment:
+                    peak_windows[-1][1] = None  # the peak continues, another blocker replaced the removed one
+                else:
+                    peak_windows.append([moment, None])
+    close_period()
+    result['peak_windows'] = [tuple(window) for window in peak_windows]
+    return result
+
+
+class TimelineWriter(BlockerWriter):
+    """Series of concurrently blocked issues per category (CSV file) and the peak-overlap windows (console)."""
+
+    def __init__(self, output_file, time_unit, step='day'):
+        super().__init__(output_file, time_unit)
+        self.step = step
+        self.intervals = []
+
+    def write(self, blocker):
+        self.intervals.append((blocker.flag_set_time, blocker.flag_removed_time, blocker.category or NO_CATEGORY))
+
+    def close(self):
+        step, label_format = TIMELINE_STEPS[self.step]
+        timeline = blocked_timeline(self.intervals, step)
+        categories = list(timeline['series'])
+        with open(f"{self.output_file}-timeline-{self.now.replace(':', '-')}.csv", "w", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['Period', 'Total'] + categories)
+            for i, period in enumerate(timeline['periods']):
+                writer.writerow([period.strftime(label_format), timeline['totals'][i]] +
+                                [timeline['series'][category][i] for category in categories])
+        print(f"\n>>> Peak: {timeline['peak']} issues blocked at the same time <<<\n")
+        for start, end in timeline['peak_windows']:
+            display_value, unit_str = format_blocking_time((end - start).total_seconds(), self.time_unit)
+            print(f"{start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M} UTC ({display_value} {unit_str})")
+
+
+def open_store(path, **options):
+    """Connection to the blocker store, created with its tables and indexes if missing."""
+    connection = sqlite3.connect(path, **options)
+    connection.execute('PRAGMA journal_mode=WAL')  # queries can read while a run writes
+    connection.executescript(STORE_SCHEMA)
+    return connection
+
+
+def store_time(moment):
+    return as_utc(moment).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def parse_store_time(value):
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def issue_project(key):
+    """Project key of an issue key, 'PROJ' for 'PROJ-12'."""
+    return key.rsplit('-', 1)[0]
+
+
+def store_row(blocker, stored_at):
+    """Parameters of STORE_UPSERT for a blocker. The project is taken from the issue key, so rows of runs without
+    --project (--jql, --input-file, targets by team or JQL) and of --serve are filtered alike by --query."""
+    return (
+        blocker.issue_key,
+        store_time(blocker.flag_set_time),
+        store_time(blocker.flag_removed_time),
+        blocker.issue_summary,
+        blocker.seconds,
+        blocker.working_seconds,
+        blocker.category,
+        blocker['Comments'],
+        int(bool(blocker.flag_was_not_removed)),
+        issue_project(blocker.issue_key),
+        blocker.team,
+        stored_at,
+    )
+
+
+class SqliteWriter(BlockerWriter):
+    """Blockers upserted into the SQLite store {output_file}.sqlite, which is kept across runs. A blocker is identified
+    by its issue key and flag set time, so running a report again updates its rows instead of adding new ones.
+    Rows are written in transactions of ROW_GROUP_SIZE blockers. See --query for reports from the store."""
+
+    def __init__(self, output_file, time_unit):
+        super().__init__(output_file, time_unit)
+        self.path = f'{output_file}.sqlite'
+        self.connection = open_store(self.path)
+        self.rows = []
+
+    def write(self, blocker):
+        self.rows.append(store_row(blocker, self.now))
+        if len(self.rows) >= ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        with self.connection:  # one transaction
+            self.connection.executemany(STORE_UPSERT, self.rows)
+        self.rows = []
+
+    def close(self):
+        self._flush()
+        self.connection.close()
+
+
+def _store_filter(start, end, projects):
+    """WHERE clause and parameters for blockers set in [start, end) (dates as YYYY-MM-DD, end may be None)
+    of the given projects (all if empty)."""
+    clauses, params = ['flag_set_time >= ?'], [start]
+    if end:
+        clauses.append('flag_set_time < ?')
+        params.append(end)
+    if projects:
+        clauses.append(f'project IN ({", ".join("?" * len(projects))})')
+        params.extend(projects)
+    return ' AND '.join(clauses), params
+
+
+def store_trends(connection, start, end=None, projects=()):
+    """(month, category, blockers, total seconds, mean seconds) of the blockers set in [start, end), by month and category."""
+    where, params = _store_filter(start, end, projects)
+    return connection.execute(f'''
+        SELECT substr(flag_set_time, 1, 7) AS month, category, count(*), sum(seconds), avg(seconds)
+        FROM blockers WHERE {where}
+        GROUP BY month, category ORDER BY month, sum(seconds) DESC''', params).fetchall()
+
+
+def store_top(connection, start, end=None, projects=(), top=10):
+    """(issue key, summary, blockers, total seconds) of the top issues by blocked time among blockers set in [start, end)."""
+    where, params = _store_filter(start, end, projects)
+    return connection.execute(f'''
+        SELECT issue_key, max(issue_summary), count(*), sum(seconds)
+        FROM blockers WHERE {where}
+        GROUP BY issue_key ORDER BY sum(seconds) DESC LIMIT ?''', params + [top]).fetchall()
+
+
+def print_store_query(path, query, time_unit, start, end=None, projects=(), top=10):
+    """Print a --query report from the blocker store, without requests to Jira."""
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    started = time.perf_counter()
+    if query == 'trends':
+        rows = store_trends(connection, start, end, projects)
+        header = ['Month', 'Category', 'Blockers', f'Total ({time_unit})', f'Mean ({time_unit})']
+        table = [[month, category or NO_CATEGORY, count, format_blocking_time(total, time_unit)[0],
+                  format_blocking_time(mean, time_unit)[0]] for month, category, count, total, mean in rows]
+    else:
+        rows = store_top(connection, start, end, projects, top)
+        header = ['Issue Key', 'Issue Summary', 'Blockers', f'Total ({time_unit})']
+        table = [[key, summary, count, format_blocking_time(total, time_unit)[0]] for key, summary, count, total in rows]
+    elapsed = time.perf_counter() - started
+    connection.close()
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *table)]
+    for row in [header] + table:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip())
+    print(f"\n>>>>> {len(table)} rows from {path} in {elapsed * 1000:.1f} ms <<<<<")
+
+
+class ProgressLine:
+    """Console line with processed issues, issues per second and ETA, redrawn at most every PROGRESS_INTERVAL seconds.
+    The ETA relies on the issue totals reported by the search, so with shards overlapping or offline input it is
+    approximate or absent."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.start = time.perf_counter()
+        self.shown = 0.0
+        self.width = 0
+
+    def update(self, issues, blockers, force=False):
+        now = time.perf_counter()
+        if not force and now - self.shown < PROGRESS_INTERVAL:
+            return
+        self.shown = now
+        elapsed = now - self.start
+        rate = issues / elapsed if elapsed > 0 else 0.0
+        line = f'Issues: {issues}, blockers: {blockers}, {rate:.1f} issues/s'
+        if rate and metrics.expected_issues > issues:
+            line += f', ETA {timedelta(seconds=round((metrics.expected_issues - issues) / rate))}'
+        self.stream.write('\r' + line.ljust(self.width))
+        self.stream.flush()
+        self.width = len(line)
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads every interval seconds: cProfile sees only the thread that enabled it,
+    while issues are searched, fetched and processed in --workers threads. Stacks are saved in the collapsed
+    format read by flamegraph.pl and speedscope, one "frame;frame;... count" line per stack."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+    def top(self, limit=15):
+        """(function, own samples, total samples) of the functions most often on top of the stack."""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [(frame, count, total[frame]) for frame, count in own.most_common(limit)]
+
+
+WRITERS = {'print': PrintWriter, 'csv': CsvWriter, 'xlsx': XlsxWriter, 'parquet': ParquetWriter, 'feather': FeatherWriter,
+           'summary': SummaryWriter, 'timeline': TimelineWriter, 'sqlite': SqliteWriter}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='jira-blocker-analyser', description='Script for flagged blockers analysis')
+    parser.add_argument('--jira-server', default='https://jira.domain.name', type=str, help='Jira server URL')
+    parser.add_argument('--jql', type=str, help='Use additional JQL parameters to select issues to analyse. If you specified project or team in arguments, do not use same clause in the JQL. Do not speicify "resolutiondate >= ..." in the JQL, use "---date" argument instead') # add your full JQL or additional conditions if needed
+    parser.add_argument('--project', type=str, help='Jira project key, or several comma-separated keys analysed in one run') # add your default project if needed
+    parser.add_argument('--team', type=str, help='Jira team field, in case several teams are working in a single project; several comma-separated teams are analysed in one run') # add your default team if needed
+    parser.add_argument('--targets', type=str, help='YAML file with a list of targets (name, project, team, jql) analysed in one run')
+    parser.add_argument('--date', default=(datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'), type=str, help='Start date')
+    parser.add_argument('--user', default='username', type=str, help='User name')
+    parser.add_argument('--password', default='password', type=str, help='Password')
+    parser.add_argument("--mode", default='print', type=str, choices=list(WRITERS), help="Output mode: print / csv / xlsx / parquet / feather / summary / timeline / sqlite")
+    parser.add_argument("--output-file", default='blockers', type=str, help="Output file name without extension, use with --mode: xlsx, csv, parquet, feather or sqlite")
+    parser.add_argument('--category-pattern', default=r"#\w+", type=str, help='Pattern for searching a blocker category in comments')
+    parser.add_argument('--category-rules', type=str, help='YAML file with category rules (category, pattern / patterns / keywords) used instead of --category-pattern')
+    parser.add_argument('--category-in-interval', action='store_true', help='If the comment added with the flag has no category, take it from the first comment of the blocked interval that has one')
+    parser.add_argument('--time-unit', default='days', choices=['days', 'hours'], help='Output blocking time in days or hours')
+    parser.add_argument('--calendar', default='wall-clock', choices=['wall-clock', 'working-hours'], help='Also output blocked working time (business days and hours, minus holidays)')
+    parser.add_argument('--working-hours', default='9-18', type=str, help='Working hours for --calendar working-hours, e.g. 9-18')
+    parser.add_argument('--holidays', type=str, help='File with holiday dates (YYYY-MM-DD, one per line) for --calendar working-hours')
+    parser.add_argument('--timeline-step', default='day', choices=list(TIMELINE_STEPS), help='Period of the --mode timeline series')
+    parser.add_argument('--workers', default=4, type=int, help='Number of parallel requests to Jira')
+    parser.add_argument('--shard-days', default=7, type=int, help='Split the search by resolution date into windows of this many days searched in parallel, 0 to disable')
+    parser.add_argument('--page-size', default=1000, type=int, help='Issues requested per search page (Jira may return less)')
+    parser.add_argument('--cache-dir', type=str, help='Directory for the local cache of issue changelogs and comments')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached issues and fetch them again, use with --cache-dir')
+    parser.add_argument('--cache-max-age', default=90, type=int, help='Remove cached issues not used for this many days')
+    parser.add_argument('--cache-max-size', default=500, type=int, help='Maximum cache size in MB, least recently used issues are removed first')
+    parser.add_argument('--pool-size', type=int, help='Keep-alive connections to Jira, by default twice --workers (search and processing threads run at the same time)')
+    parser.add_argument('--timeout', default=60, type=float, help='Seconds to wait for Jira to connect or to send data, per request')
+    parser.add_argument('--retries', default=3, type=int, help='Retries of a GET request failing with a connection error, timeout or HTTP 5xx')
+    parser.add_argument('--no-bulk-fetch', action='store_true', help='Do not request changelog and comments in the search, fetch every issue separately')
+    parser.add_argument('--query', choices=['trends', 'top'], help='Report from the --mode sqlite store (--output-file) for blockers set from --date until --until, without Jira: blocked time per category and month, or the top issues')
+    parser.add_argument('--until', type=str, help='End date (exclusive) of the --query range, YYYY-MM-DD')
+    parser.add_argument('--top', default=10, type=int, help='Number of issues in --query top')
+    parser.add_argument('--serve', type=str, metavar='HOST:PORT', help='Run as a service: keep the --output-file sqlite store up to date from Jira webhooks and serve the blocked-now list and reports over HTTP')
+    parser.add_argument('--journal', type=str, help='Record processed issues and their blockers in this NDJSON file as the run proceeds')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run: take issues recorded in --journal from it and process only the rest')
+    parser.add_argument('--input-file', type=str, help='Analyse issues from a JSON export or NDJSON dump instead of Jira')
+    parser.add_argument('--metrics-json', type=str, help='Save per-phase timings, request counters and latency histogram to this JSON file')
+    parser.add_argument('--profile', type=str, help='Sample the stacks of all threads during the run and save them to this file (collapsed stack format)')
+    args = parser.parse_args()
+    if args.resume and not args.journal:
+        parser.error('--resume requires --journal')
+    if args.serve and args.input_file:
+        parser.error('--serve needs Jira, it cannot be used with --input-file')
+    if args.cache_dir and args.input_file:
+        parser.error('--cache-dir caches issues fetched from Jira, it cannot be used with --input-file')
+    if args.query:
+        store = f'{args.output_file}.sqlite'
+        if not os.path.exists(store):
+            parser.error(f'{store} does not exist, fill it with --mode sqlite first')
+        print_store_query(store, args.query, args.time_unit, args.date, args.until, split_list(args.project), args.top)
+        return
+
+    run_wall, run_cpu = time.perf_counter(), time.process_time()
+    profiler = SamplingProfiler() if args.profile else None
+    if profiler:
+        profiler.start()
+
+    global jira
+    jira = None if args.input_file else connect_jira(args.jira_server, args.user, args.password,
+                                                     args.pool_size or 2 * args.workers, args.timeout, args.retries)
+    metrics.install(jira)
+    global category_pattern, category_in_interval
+    category_pattern = load_category_rules(args.category_rules) if args.category_rules else args.category_pattern
+    category_in_interval = args.category_in_interval
+    if args.calendar == 'working-hours':
+        global working_calendar
+        start_hour, end_hour = (int(hour) for hour in args.working_hours.split('-'))
+        working_calendar = WorkingCalendar(load_holidays(args.holidays) if args.holidays else (), start_hour, end_hour)
+
+    if args.serve:
+        # Service mode: no search, only the issues reported by webhooks are fetched
+        from .service import BlockerService, webhook_server
+        service = BlockerService(jira, f'{args.output_file}.sqlite', args.time_unit)
+        server = webhook_server(service, args.serve)
+        service.start()
+        host, port = server.server_address[:2]
+        print(f'Serving on http://{host}:{port}: POST /webhook, GET /blocked, /report, /status')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.stop()
+        return
+
+    # One target per project and team combination (or per entry of --targets); all of them share the Jira client
+    targets = make_targets(args.jql, split_list(args.project), split_list(args.team),
+                           load_targets(args.targets) if args.targets else None)
+    global target_columns
+    target_columns = len(targets) > 1 or bool(args.targets)
+    for target in targets:
+        jql_query = target.base_query
+        if args.date:
+            jql_query += f' and resolutiondate >= {args.date}' if jql_query else f'resolutiondate >= {args.date}'
+        # Append the mandatory clause
+        jql_query += FLAG_CLAUSE
+        # Deep startAt offsets are slow, so the date range is split into shards searched in parallel
+        target.queries = date_shard_queries(target.base_query, args.date, args.shard_days) or [jql_query]
+        target.jql_query = jql_query
+
+    # Bulk-fetch mode: changelog and comments come with the search results, no extra request per issue
+    search_options = {} if args.no_bulk_fetch else {'fields': SEARCH_FIELDS, 'expand': 'changelog'}
+    cache = None
+    if args.cache_dir:
+        cache = IssueCache(args.cache_dir, args.refresh, args.cache_max_age, args.cache_max_size)
+        cache.evict()
+        search_options = {'fields': 'updated'}  # history is taken from the cache, only changed issues are fetched
+
+    if args.input_file:
+        # Offline: the file is parsed in parallel processes, processing threads would only contend for the GIL
+        targets = [Target(args.input_file, '')]
+        target_columns = False
+        pairs = ((targets[0], issue) for issue in offline_issues(args.input_file, args.workers))
+        process_workers = 1
+        print(f'Input file used: {args.input_file}\n\n')
+    else:
+        # Shards of all targets are searched on the same --workers pool
+        pairs = search_targets(jira, targets, args.page_size, args.workers, **search_options)
+        process_workers = args.workers
+
+        for target in targets:
+            print (f'JQL query used: {target.jql_query}')
+        print('\n')
+
+    # Issues flow from the search pages through process_issue to the writer; only the pages read ahead
+    # (--workers * SEARCH_PREFETCH_PAGES) and the issues in flight are held in memory
+    issue_count = 0
+    blocker_count = 0
+    # per target: issues, blockers, blocked seconds, blockers with the flag not removed
+    target_totals = {target.name: [0, 0, 0.0, 0] for target in targets}
+    writer_options = {'timeline': {'step': args.timeline_step}}.get(args.mode, {})
+    def process(pairs):
+        if cache:
+            pairs = paired(partial(cached_full_issues, jira, cache=cache, workers=args.workers), pairs)
+        return paired(partial(process_issues, jira, workers=process_workers), pairs)
+
+    # With --resume the issues recorded in the journal are not fetched again, their blockers come from the journal
+    journal = Journal(args.journal, args.resume) if args.journal else None
+    if journal and journal.done:
+        print(f'Resuming: {len(journal.done)} issues taken from {args.journal}\n')
+    results = merge_journal(pairs, journal.done if journal else {}, process)
+    with WRITERS[args.mode](args.output_file, args.time_unit, **writer_options) as writer:
+        progress = ProgressLine() if writer.progress else None
+        for target, key, blockers, journaled in results:
+            if not journaled:
+                for blocker in blockers:
+                    blocker.project = target.project
+                    blocker.team = target.team
+                if journal:
+                    journal.record(target, key, blockers)
+            issue_count += 1
+            totals = target_totals[target.name]
+            totals[0] += 1
+            with metrics.phase('write'):
+                for blocker in blockers:
+                    writer.write(blocker)
+                    totals[2] += blocker.seconds
+                    totals[3] += bool(blocker.flag_was_not_removed)
+            totals[1] += len(blockers)
+            blocker_count += len(blockers)
+            if progress:
+                progress.update(issue_count, blocker_count)
+        if progress:
+            progress.update(issue_count, blocker_count, force=True)
+    if journal:
+        journal.close()
+    print()
+
+    if len(targets) > 1:
+        print(f">>>>> Per target ({args.time_unit} blocked) <<<<<")
+        width = max(len(name) for name in target_totals)
+        for name, (issues_found, blockers_found, seconds, not_removed) in target_totals.items():
+            blocked = format_blocking_time(seconds, args.time_unit)[0]
+            print(f"{name:<{width}}  {issues_found:>6} issues  {blockers_found:>6} blockers  {blocked:>9} blocked  "
+                  f"{not_removed:>5} flags not removed")
+        print()
+    print(f">>>>> Found {issue_count} issues <<<<<")
+    print(f">>>>> Found {blocker_count} blockers <<<<<\n\n")
+
+    if profiler:
+        profiler.stop()
+        profiler.save(args.profile)
+        print(f'Most sampled functions (own / total samples), stacks saved to {args.profile}:')
+        for frame, own, total in profiler.top():
+            print(f'{own:>8} {total:>8}  {frame}')
+    if args.metrics_json:
+        report = metrics.report()
+        report.update(issues=issue_count, blockers=blocker_count,
+                      wall=time.perf_counter() - run_wall, cpu=time.process_time() - run_cpu)
+        with open(args.metrics_json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
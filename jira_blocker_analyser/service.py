@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""--serve: a long-running service that keeps the blocker store up to date from Jira webhooks.
+Imported only when the service is started, so one-off runs do not load the HTTP server modules."""
+import json
+import queue
+import sqlite3
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from . import analyser
+from .analyser import (NO_CATEGORY, SEARCH_FIELDS, STORE_UPSERT, CommentIndex, as_utc, blocker_category_from_comment,
+                       call_with_retry, extract_blockers, fetch_full_issue, format_blocking_time, issue_from_raw,
+                       issue_project, metrics, open_store, parse_store_time, slim_issue_raw, split_list, store_row,
+                       store_time, store_top, store_trends)
+
+# Jira webhook events after which --serve refreshes the issue, others are ignored
+WEBHOOK_EVENTS = {'jira:issue_created', 'jira:issue_updated', 'jira:issue_deleted',
+                  'comment_created', 'comment_updated', 'comment_deleted'}
+
+
+class BlockerService:
+    """State of --serve: blockers of the issues reported by Jira webhooks, kept in the SQLite store and, for the issues
+    flagged now, in memory. A webhook only queues the issue key; a worker thread fetches the issue and replaces its rows,
+    so a burst of events on one issue costs one request. Events that cannot change any blocker (changes of issues
+    that were never flagged, other than setting the flag) are not fetched at all."""
+
+    def __init__(self, jira, path, time_unit):
+        self.jira = jira
+        self.path = path
+        self.time_unit = time_unit
+        self.connection = open_store(path, check_same_thread=False)  # written by the worker thread only
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.pending = {}  # issue key -> action of its latest event, while the key is queued
+        self.counts = Counter()
+        self.blocked = {}
+        for key, summary, flag_set_time, category, project in self.connection.execute(
+                'SELECT issue_key, issue_summary, flag_set_time, category, project FROM open_blockers'):
+            self.blocked[key] = self._open_blocker(key, summary, parse_store_time(flag_set_time), category, project)
+        self.tracked = {key for (key,) in self.connection.execute('SELECT DISTINCT issue_key FROM blockers')}
+        self.tracked.update(self.blocked)
+        self.worker = threading.Thread(target=self._run, name='blocker-service', daemon=True)
+
+    @staticmethod
+    def _open_blocker(key, summary, flag_set_time, category, project):
+        return {'issue_key': key, 'issue_summary': summary, 'flag_set_time': flag_set_time, 'category': category,
+                'project': project}
+
+    def start(self):
+        self.worker.start()
+
+    def stop(self):
+        """Process the queued events and stop the worker thread."""
+        self.queue.put(None)
+        self.worker.join()
+        self.connection.close()
+
+    def submit(self, payload):
+        """Queue the issue of a webhook payload for refresh. False if the event is ignored."""
+        event = payload.get('webhookEvent')
+        key = (payload.get('issue') or {}).get('key')
+        if event not in WEBHOOK_EVENTS or not key:
+            self.counts['ignored'] += 1
+            return False
+        items = (payload.get('changelog') or {}).get('items') or []
+        with self.lock:
+            if event != 'jira:issue_deleted' and key not in self.tracked \
+                    and not any(item.get('field') == 'Flagged' for item in items):
+                self.counts['ignored'] += 1
+                return False
+            queued = key in self.pending
+            self.pending[key] = 'delete' if event == 'jira:issue_deleted' else 'refresh'
+            self.counts['queued'] += 1
+        if not queued:  # otherwise the refresh already queued sees this change too
+            self.queue.put(key)
+        return True
+
+    def _run(self):
+        while True:
+            key = self.queue.get()
+            try:
+                if key is None:
+                    return
+                with self.lock:
+                    action = self.pending.pop(key)
+                self.replace(key, self.fetch(key) if action == 'refresh' else None)
+            except Exception as e:
+                self.counts['errors'] += 1
+                print(f'Failed to update {key}: {e}', file=sys.stderr)
+            finally:
+                self.queue.task_done()
+
+    def fetch(self, key):
+        """The issue with its full changelog and comments, None if Jira does not return it (deleted, moved away)."""
+        self.counts['fetched'] += 1
+        try:
+            raw = call_with_retry(self.jira._get_json, f'issue/{key}', params={'expand': 'changelog', 'fields': SEARCH_FIELDS})
+        except Exception as e:
+            if getattr(e, 'status_code', None) != 404:
+                raise
+            return None
+        return fetch_full_issue(self.jira, issue_from_raw(slim_issue_raw(raw)))
+
+    def replace(self, key, issue):
+        """Replace the stored blockers of an issue by those in its current history; None removes the issue."""
+        blockers = []
+        open_blocker = None
+        if issue is not None:
+            blockers, flag_set_time = extract_blockers(issue)
+            if flag_set_time:
+                comments = CommentIndex(issue.fields.comment.comments)
+                category = blocker_category_from_comment(comments, flag_set_time, analyser.category_pattern)
+                open_blocker = self._open_blocker(key, issue.fields.summary, as_utc(flag_set_time), category,
+                                                  issue_project(key))
+        stored_at = store_time(datetime.now(timezone.utc))
+        with self.connection:  # one transaction, readers see the old or the new blockers of the issue
+            self.connection.execute('DELETE FROM blockers WHERE issue_key = ?', (key,))
+            self.connection.execute('DELETE FROM open_blockers WHERE issue_key = ?', (key,))
+            self.connection.executemany(STORE_UPSERT, [store_row(blocker, stored_at) for blocker in blockers])
+            if open_blocker:
+                self.connection.execute('INSERT INTO open_blockers VALUES (?, ?, ?, ?, ?, ?)', (
+                    key, open_blocker['issue_summary'], store_time(open_blocker['flag_set_time']),
+                    open_blocker['category'], open_blocker['project'], stored_at))
+        with self.lock:
+            if open_blocker:
+                self.blocked[key] = open_blocker
+            else:
+                self.blocked.pop(key, None)
+            if open_blocker or blockers:
+                self.tracked.add(key)
+            else:
+                self.tracked.discard(key)
+
+    def blocked_now(self, projects=(), now=None):
+        """Issues flagged now, blocked the longest first, with the time blocked so far in --time-unit."""
+        now = now or datetime.now(timezone.utc)
+        with self.lock:
+            blocked = [dict(item) for item in self.blocked.values() if not projects or item['project'] in projects]
+        blocked.sort(key=lambda item: item['flag_set_time'])
+        for item in blocked:
+            item['blocked'] = format_blocking_time((now - item['flag_set_time']).total_seconds(), self.time_unit)[0]
+            item['flag_set_time'] = item['flag_set_time'].isoformat()
+        return {'time_unit': self.time_unit, 'issues': blocked}
+
+    def report(self, query, start, end=None, projects=(), top=10):
+        """--query report from the store as JSON rows, blocking time in --time-unit."""
+        connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        try:
+            if query == 'trends':
+                rows = [{'month': month, 'category': category or NO_CATEGORY, 'blockers': count,
+                         'total': format_blocking_time(total, self.time_unit)[0],
+                         'mean': format_blocking_time(mean, self.time_unit)[0]}
+                        for month, category, count, total, mean in store_trends(connection, start, end, projects)]
+            else:
+                rows = [{'issue_key': key, 'issue_summary': summary, 'blockers': count,
+                         'total': format_blocking_time(total, self.time_unit)[0]}
+                        for key, summary, count, total in store_top(connection, start, end, projects, top)]
+        finally:
+            connection.close()
+        return {'time_unit': self.time_unit, 'rows': rows}
+
+    def status(self):
+        with self.lock:
+            counts = dict(self.counts, pending=len(self.pending), blocked=len(self.blocked), tracked=len(self.tracked))
+        return dict(metrics.report(), webhooks=counts)
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """HTTP endpoints of --serve: POST /webhook for Jira webhooks; GET /blocked (issues flagged now), /report
+    (the --query reports, parameters query, from, until, project, top) and /status (counters)."""
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/webhook':
+            return self._reply(404, {'error': 'not found'})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        except ValueError:
+            return self._reply(400, {'error': 'invalid JSON'})
+        queued = isinstance(payload, dict) and self.server.service.submit(payload)
+        self._reply(202 if queued else 200, {'queued': queued})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        projects = split_list(params.get('project'))
+        service = self.server.service
+        if url.path == '/blocked':
+            return self._reply(200, service.blocked_now(projects))
+        if url.path == '/report':
+            query = params.get('query', 'trends')
+            if query not in ('trends', 'top'):
+                return self._reply(400, {'error': 'query must be trends or top'})
+            top = params.get('top', '10')
+            if not top.isdigit():
+                return self._reply(400, {'error': 'top must be a non-negative integer'})
+            start = params.get('from') or (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+            return self._reply(200, service.report(query, start, params.get('until'), projects, int(top)))
+        if url.path == '/status':
+            return self._reply(200, service.status())
+        self._reply(404, {'error': 'not found'})
+
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def webhook_server(service, address):
+    """ThreadingHTTPServer of --serve on HOST:PORT (host defaults to 127.0.0.1, port 0 picks a free one)."""
+    host, _, port = address.rpartition(':')
+    server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), WebhookHandler)
+    server.service = service
+    return server
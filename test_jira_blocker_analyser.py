@@ -4,31 +4,92 @@ import sys
 import unittest
 import unittest.mock
 import importlib.util
-from datetime import datetime, timezone
-
-# Mock dependencies so module loads without jira/numpy/pandas installed
-class NumpyMock:
-    @staticmethod
-    def round(x, decimals=0):
-        return round(float(x), decimals)
-
-sys.modules["numpy"] = NumpyMock()
-sys.modules["jira"] = unittest.mock.MagicMock()
-sys.modules["pandas"] = unittest.mock.MagicMock()
-
-# Load module with hyphen in filename
-spec = importlib.util.spec_from_file_location(
-    "jira_blocker_analyser",
-    "jira-blocker-analyser.py"
-)
-jira_blocker_analyser = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(jira_blocker_analyser)
+import csv
+import gzip
+import http.server
+import io
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+# Heavy optional dependencies (jira, pandas, numpy...) are imported only where used, no mocks are needed
+import jira_blocker_analyser.analyser as jira_blocker_analyser
+from jira_blocker_analyser import service
 
 blocker_category_from_comment = jira_blocker_analyser.blocker_category_from_comment
 comments_text = jira_blocker_analyser.comments_text
 blocker_info_to_dict = jira_blocker_analyser.blocker_info_to_dict
 process_issue = jira_blocker_analyser.process_issue
 format_blocking_time = jira_blocker_analyser.format_blocking_time
+process_issues = jira_blocker_analyser.process_issues
+call_with_retry = jira_blocker_analyser.call_with_retry
+RateLimiter = jira_blocker_analyser.RateLimiter
+date_shard_queries = jira_blocker_analyser.date_shard_queries
+search_all = jira_blocker_analyser.search_all
+search_sharded = jira_blocker_analyser.search_sharded
+issue_from_raw = jira_blocker_analyser.issue_from_raw
+slim_issue_raw = jira_blocker_analyser.slim_issue_raw
+fetch_full_issue = jira_blocker_analyser.fetch_full_issue
+IssueCache = jira_blocker_analyser.IssueCache
+cached_full_issues = jira_blocker_analyser.cached_full_issues
+ordered_map = jira_blocker_analyser.ordered_map
+prefetched = jira_blocker_analyser.prefetched
+SEARCH_PREFETCH_PAGES = jira_blocker_analyser.SEARCH_PREFETCH_PAGES
+batched = jira_blocker_analyser.batched
+CsvWriter = jira_blocker_analyser.CsvWriter
+PrintWriter = jira_blocker_analyser.PrintWriter
+XlsxWriter = jira_blocker_analyser.XlsxWriter
+ParquetWriter = jira_blocker_analyser.ParquetWriter
+FeatherWriter = jira_blocker_analyser.FeatherWriter
+SummaryWriter = jira_blocker_analyser.SummaryWriter
+TimelineWriter = jira_blocker_analyser.TimelineWriter
+WorkingCalendar = jira_blocker_analyser.WorkingCalendar
+JsonStream = jira_blocker_analyser.JsonStream
+ndjson_chunks = jira_blocker_analyser.ndjson_chunks
+read_issue_file = jira_blocker_analyser.read_issue_file
+offline_issues = jira_blocker_analyser.offline_issues
+RunMetrics = jira_blocker_analyser.RunMetrics
+make_targets = jira_blocker_analyser.make_targets
+load_targets = jira_blocker_analyser.load_targets
+search_targets = jira_blocker_analyser.search_targets
+paired = jira_blocker_analyser.paired
+Journal = jira_blocker_analyser.Journal
+merge_journal = jira_blocker_analyser.merge_journal
+blocker_to_json = jira_blocker_analyser.blocker_to_json
+blocker_from_json = jira_blocker_analyser.blocker_from_json
+Target = jira_blocker_analyser.Target
+configure_session = jira_blocker_analyser.configure_session
+SqliteWriter = jira_blocker_analyser.SqliteWriter
+store_trends = jira_blocker_analyser.store_trends
+store_top = jira_blocker_analyser.store_top
+print_store_query = jira_blocker_analyser.print_store_query
+BlockerService = service.BlockerService
+WebhookHandler = service.WebhookHandler
+webhook_server = service.webhook_server
+extract_blockers = jira_blocker_analyser.extract_blockers
+CategoryRules = jira_blocker_analyser.CategoryRules
+load_category_rules = jira_blocker_analyser.load_category_rules
+rule_pattern_error = jira_blocker_analyser.rule_pattern_error
+ProgressLine = jira_blocker_analyser.ProgressLine
+SamplingProfiler = jira_blocker_analyser.SamplingProfiler
+load_holidays = jira_blocker_analyser.load_holidays
+blocked_timeline = jira_blocker_analyser.blocked_timeline
+CommentIndex = jira_blocker_analyser.CommentIndex
+BlockerRecord = jira_blocker_analyser.BlockerRecord
+parse_jira_time = jira_blocker_analyser.parse_jira_time
 
 
 def make_comment(created: str, body: str):
@@ -66,6 +127,15 @@ def make_issue_with_changelog(key: str, summary: str, histories: list, comments:
     return issue
 
 
+def make_expanded_issue(key: str, summary: str, histories: list, comments: list = None,
+                        changelog_total: int = None, comments_total: int = None):
+    """Create issue as returned by search_issues with expand=changelog (lists carry 'total')."""
+    issue = make_issue_with_changelog(key, summary, histories, comments)
+    issue.changelog.total = len(histories) if changelog_total is None else changelog_total
+    issue.fields.comment.total = len(comments or []) if comments_total is None else comments_total
+    return issue
+
+
 class TestProcessIssue(unittest.TestCase):
     def setUp(self):
         jira_blocker_analyser.category_pattern = r"#\w+"
@@ -83,6 +153,23 @@ class TestProcessIssue(unittest.TestCase):
         self.assertEqual(result, [])
         jira.issue.assert_called_once_with("PROJ-1", expand="changelog")
 
+    def test_flag_still_set_without_status_changes_is_not_a_blocker_yet(self):
+        histories = [
+            make_history("2024-01-15T10:00:00.000000+0000", [
+                make_changelog_item("Flagged", to_string="Impediment"),
+            ]),
+        ]
+        issue = make_issue_with_changelog("PROJ-1", "Summary", histories)
+        self.assertEqual(extract_blockers(issue), ([], datetime(2024, 1, 15, 10, tzinfo=timezone.utc)))
+
+    def test_flag_set_after_last_status_change_is_still_blocking(self):
+        histories = [
+            make_history("2024-01-15T09:00:00.000000+0000", [make_changelog_item("status", to_string="In Progress")]),
+            make_history("2024-01-15T10:00:00.000000+0000", [make_changelog_item("Flagged", to_string="Impediment")]),
+        ]
+        issue = make_issue_with_changelog("PROJ-1", "Summary", histories)
+        self.assertEqual(extract_blockers(issue), ([], datetime(2024, 1, 15, 10, tzinfo=timezone.utc)))
+
     def test_one_blocker_cycle_set_then_removed_stores_seconds(self):
         histories = [
             make_history("2024-01-15T10:00:00.000000+0000", [
@@ -172,6 +259,1356 @@ class TestProcessIssue(unittest.TestCase):
         self.assertEqual(result[0]["Flag Removed Time"], "2024-01-15 11:00")
 
 
+    def test_expanded_issue_processed_without_extra_request(self):
+        histories = [
+            make_history("2024-01-15T10:00:00.000000+0000", [
+                make_changelog_item("Flagged", to_string="Impediment"),
+            ]),
+            make_history("2024-01-15T12:00:00.000000+0000", [
+                make_changelog_item("Flagged", from_string="Impediment"),
+            ]),
+        ]
+        issue = make_expanded_issue("PROJ-6", "Bulk fetched", histories)
+        jira = unittest.mock.MagicMock()
+        result = process_issue(jira, issue)
+        jira.issue.assert_not_called()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]["Time Blocked"], 7200)
+
+    def test_truncated_changelog_is_fetched_again(self):
+        issue = make_expanded_issue("PROJ-7", "Long history", [], changelog_total=150)
+        full_issue = make_expanded_issue("PROJ-7", "Long history", [])
+        jira = unittest.mock.MagicMock()
+        jira.issue.return_value = full_issue
+        process_issue(jira, issue)
+        jira.issue.assert_called_once_with("PROJ-7", expand="changelog")
+
+    def test_truncated_comments_are_fetched_again(self):
+        issue = make_expanded_issue("PROJ-8", "Many comments", [], comments_total=60)
+        jira = unittest.mock.MagicMock()
+        jira.issue.return_value = make_expanded_issue("PROJ-8", "Many comments", [])
+        process_issue(jira, issue)
+        jira.issue.assert_called_once_with("PROJ-8", expand="changelog")
+
+
+class TestProcessIssues(unittest.TestCase):
+    def setUp(self):
+        jira_blocker_analyser.category_pattern = r"#\w+"
+
+    def _issues(self, count):
+        issues = []
+        for i in range(count):
+            histories = [
+                make_history("2024-01-15T10:00:00.000000+0000", [
+                    make_changelog_item("Flagged", to_string="Impediment"),
+                ]),
+                make_history(f"2024-01-15T1{i % 10}:30:00.000000+0000", [
+                    make_changelog_item("Flagged", from_string="Impediment"),
+                ]),
+            ]
+            issues.append(make_issue_with_changelog(f"PROJ-{i}", "Task", histories))
+        return issues
+
+    def test_parallel_results_keep_issue_order(self):
+        issues = self._issues(20)
+        by_key = {issue.key: issue for issue in issues}
+
+        def slow_issue(key, expand=None):
+            # later issues answer faster, so completion order differs from issue order
+            time.sleep(0.001 * (20 - int(key.split("-")[1])))
+            return by_key[key]
+
+        jira = unittest.mock.MagicMock()
+        jira.issue.side_effect = slow_issue
+        results = list(process_issues(jira, issues, workers=8))
+        self.assertEqual([r[0]["Issue Key"] for r in results], [i.key for i in issues])
+
+    def test_single_worker_is_serial(self):
+        issues = self._issues(3)
+        jira = unittest.mock.MagicMock()
+        jira.issue.side_effect = lambda key, expand=None: next(i for i in issues if i.key == key)
+        results = list(process_issues(jira, issues, workers=1))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(jira.issue.call_count, 3)
+
+
+def search_page(raw_issues, total, start_at=0):
+    """Raw JSON of a search_issues page (json_result=True)."""
+    return {"startAt": start_at, "maxResults": len(raw_issues), "total": total, "issues": raw_issues}
+
+
+def make_search_jira(results_by_query):
+    """Jira mock whose search_issues pages through a list of issue keys per query."""
+    def search_issues(jql, startAt=0, maxResults=50, json_result=False, **kwargs):
+        keys = results_by_query[jql]
+        return search_page([{"key": key, "fields": {}} for key in keys[startAt:startAt + maxResults]], len(keys), startAt)
+
+    jira = unittest.mock.MagicMock()
+    jira.search_issues.side_effect = search_issues
+    return jira
+
+
+class TestSearch(unittest.TestCase):
+    def test_date_shards_cover_range_with_open_last_shard(self):
+        queries = date_shard_queries("project = PROJ", "2024-01-01", 7, today=date(2024, 1, 20))
+        self.assertEqual(queries, [
+            'project = PROJ and resolutiondate >= 2024-01-01 and resolutiondate < 2024-01-08 and comment ~ "(flag) Flag added"',
+            'project = PROJ and resolutiondate >= 2024-01-08 and resolutiondate < 2024-01-15 and comment ~ "(flag) Flag added"',
+            'project = PROJ and resolutiondate >= 2024-01-15 and comment ~ "(flag) Flag added"',
+        ])
+
+    def test_date_shards_without_base_query(self):
+        queries = date_shard_queries("", "2024-01-01", 30, today=date(2024, 1, 20))
+        self.assertEqual(queries, ['resolutiondate >= 2024-01-01 and comment ~ "(flag) Flag added"'])
+
+    def test_no_shards_for_relative_date_or_disabled(self):
+        self.assertEqual(date_shard_queries("", "-30d", 7), [])
+        self.assertEqual(date_shard_queries("", "2024-01-01", 0), [])
+
+    def test_search_all_stops_on_total_without_empty_page(self):
+        jira = make_search_jira({"q": [f"P-{i}" for i in range(5)]})
+        pages = list(search_all(jira, "q", page_size=2))
+        self.assertEqual([[i.key for i in page] for page in pages], [["P-0", "P-1"], ["P-2", "P-3"], ["P-4"]])
+        self.assertEqual(jira.search_issues.call_count, 3)
+
+    def test_search_all_without_total_pages_with_next_page_token(self):
+        keys = [f"P-{i}" for i in range(5)]
+
+        def cloud_page(jql, offset, size):
+            # Jira Cloud enhanced search: no total, a token for the next page, isLast on the last one
+            page = {"issues": [{"key": key, "fields": {}} for key in keys[offset:offset + size]]}
+            if offset + size < len(keys):
+                page["nextPageToken"] = f"token-{offset + size}"
+            elif jql == "is-last":
+                page["isLast"] = True
+            return page
+
+        def search_issues(jql, startAt=0, maxResults=50, json_result=False, **kwargs):
+            if startAt > 0:
+                raise JiraErrorStub(400)  # the jira library refuses startAt on Cloud
+            return cloud_page(jql, 0, maxResults)
+
+        def enhanced_search_issues(jql, nextPageToken=None, maxResults=50, json_result=False, **kwargs):
+            return cloud_page(jql, int(nextPageToken.split("-")[1]) if nextPageToken else 0, maxResults)
+
+        jira = unittest.mock.MagicMock()
+        jira.search_issues.side_effect = search_issues
+        jira.enhanced_search_issues.side_effect = enhanced_search_issues
+        for query in ("is-last", "no-token"):
+            jira.reset_mock()
+            self.assertEqual([i.key for page in search_all(jira, query, page_size=2, fields="updated") for i in page], keys)
+            self.assertEqual(jira.search_issues.call_count, 1)
+            self.assertEqual(jira.enhanced_search_issues.call_count, 2)
+        jira.enhanced_search_issues.assert_called_with("no-token", nextPageToken="token-4", maxResults=2,
+                                                       json_result=True, fields="updated")
+
+    def test_search_all_passes_search_options(self):
+        jira = make_search_jira({"q": ["P-1"]})
+        list(search_all(jira, "q", page_size=100, fields="summary,comment", expand="changelog"))
+        jira.search_issues.assert_called_once_with("q", startAt=0, maxResults=100, json_result=True,
+                                                   fields="summary,comment", expand="changelog")
+
+    def test_sharded_results_merged_in_order_and_deduplicated(self):
+        jira = make_search_jira({
+            "week1": ["P-1", "P-2"],
+            "week2": ["P-2", "P-3"],
+            "week3": ["P-4"],
+        })
+        issues = search_sharded(jira, ["week1", "week2", "week3"], page_size=1, workers=3)
+        self.assertEqual([i.key for i in issues], ["P-1", "P-2", "P-3", "P-4"])
+
+    def test_search_all_requests_pages_lazily(self):
+        jira = make_search_jira({"q": [f"P-{i}" for i in range(5)]})
+        pages = search_all(jira, "q", page_size=2)
+        self.assertEqual(jira.search_issues.call_count, 0)
+        next(pages)
+        self.assertEqual(jira.search_issues.call_count, 1)
+
+    def test_sharded_search_reads_a_bounded_number_of_pages_ahead(self):
+        jira = make_search_jira({f"week{w}": [f"P-{w}-{i}" for i in range(50)] for w in range(3)})
+        issues = search_sharded(jira, ["week0", "week1", "week2"], page_size=1, workers=3)
+        self.assertEqual(next(issues).key, "P-0-0")
+        time.sleep(0.3)
+        # the page being consumed, and per shard the pages in the buffer and one waiting to be put there
+        self.assertLessEqual(jira.search_issues.call_count, 1 + 3 * (SEARCH_PREFETCH_PAGES + 1))
+        self.assertEqual(len(list(issues)), 149)
+
+    def test_prefetched_raises_errors_of_the_iterators_in_order(self):
+        def failing():
+            yield 1
+            raise ValueError("page")
+
+        results = prefetched([iter([0]), failing(), iter([2])], workers=2)
+        self.assertEqual([next(results), next(results)], [0, 1])
+        with self.assertRaises(ValueError):
+            next(results)
+
+
+def make_raw_issue(key: str, updated: str = "2024-01-20T10:00:00.000+0000"):
+    """REST JSON of an issue with one complete flag cycle and one comment."""
+    histories = [
+        {"created": "2024-01-15T10:00:00.000+0000",
+         "items": [{"field": "Flagged", "fromString": None, "toString": "Impediment"}]},
+        {"created": "2024-01-15T12:00:00.000+0000",
+         "items": [{"field": "Flagged", "fromString": "Impediment", "toString": None}]},
+    ]
+    comments = [{"created": "2024-01-15T11:00:00.000+0000", "body": "Waiting for review"}]
+    return {
+        "key": key,
+        "fields": {
+            "summary": f"Summary of {key}",
+            "updated": updated,
+            "comment": {"startAt": 0, "maxResults": 50, "total": 1, "comments": comments},
+            "labels": ["not", "cached"],
+        },
+        "changelog": {"startAt": 0, "maxResults": 100, "total": 2, "histories": histories},
+    }
+
+
+class TestIssueCache(unittest.TestCase):
+    def setUp(self):
+        jira_blocker_analyser.category_pattern = r"#\w+"
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = tmp.name
+
+    def test_issue_from_raw_is_processed_without_request(self):
+        jira = unittest.mock.MagicMock()
+        result = process_issue(jira, issue_from_raw(make_raw_issue("PROJ-1")))
+        jira.issue.assert_not_called()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]["Issue Summary"], "Summary of PROJ-1")
+        self.assertEqual(result[0]["Comments"], "Waiting for review\n---\n")
+
+    def test_get_returns_stored_issue_while_updated_is_same(self):
+        cache = IssueCache(self.cache_dir)
+        cache.put(issue_from_raw(make_raw_issue("PROJ-1")))
+        cached = cache.get("PROJ-1", "2024-01-20T10:00:00.000+0000")
+        self.assertEqual(cached.fields.summary, "Summary of PROJ-1")
+        self.assertEqual(len(cached.changelog.histories), 2)
+        self.assertFalse(hasattr(cached.fields, "labels"))  # only fields used by the analysis are kept
+
+    def test_get_misses_when_issue_updated_or_refresh(self):
+        IssueCache(self.cache_dir).put(issue_from_raw(make_raw_issue("PROJ-1")))
+        self.assertIsNone(IssueCache(self.cache_dir).get("PROJ-1", "2024-02-01T00:00:00.000+0000"))
+        self.assertIsNone(IssueCache(self.cache_dir).get("PROJ-2", "2024-01-20T10:00:00.000+0000"))
+        self.assertIsNone(IssueCache(self.cache_dir, refresh=True).get("PROJ-1", "2024-01-20T10:00:00.000+0000"))
+
+    def test_evict_removes_old_entries_and_least_recently_used_over_size(self):
+        cache = IssueCache(self.cache_dir, max_age_days=30)
+        for number, age_days in ((1, 40), (2, 10), (3, 0)):
+            cache.put(issue_from_raw(make_raw_issue(f"PROJ-{number}")))
+            used = time.time() - age_days * 86400
+            os.utime(os.path.join(self.cache_dir, f"PROJ-{number}.json.gz"), (used, used))
+        self.assertEqual(cache.evict(), 1)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ["PROJ-2.json.gz", "PROJ-3.json.gz"])
+        cache.max_size_mb = os.path.getsize(os.path.join(self.cache_dir, "PROJ-3.json.gz")) / (1024 * 1024)
+        self.assertEqual(cache.evict(), 1)
+        self.assertEqual(os.listdir(self.cache_dir), ["PROJ-3.json.gz"])
+
+    def test_cached_full_issues_fetches_only_changed_issues(self):
+        cache = IssueCache(self.cache_dir)
+        cache.put(issue_from_raw(make_raw_issue("PROJ-1")))
+        search_hits = [issue_from_raw({"key": key, "fields": {"updated": "2024-01-20T10:00:00.000+0000"}})
+                       for key in ("PROJ-1", "PROJ-2")]
+        jira = unittest.mock.MagicMock()
+        jira.search_issues.return_value = search_page([make_raw_issue("PROJ-2")], 1)
+        issues = list(cached_full_issues(jira, search_hits, cache))
+        jira.search_issues.assert_called_once_with("key in (PROJ-2)", startAt=0, maxResults=100, json_result=True,
+                                                   fields="summary,comment,updated", expand="changelog")
+        self.assertEqual([i.key for i in issues], ["PROJ-1", "PROJ-2"])
+        self.assertIsNotNone(cache.get("PROJ-2", "2024-01-20T10:00:00.000+0000"))
+        jira.search_issues.reset_mock()
+        list(cached_full_issues(jira, search_hits, cache))
+        jira.search_issues.assert_not_called()
+
+
+class TestRawJson(unittest.TestCase):
+    def setUp(self):
+        jira_blocker_analyser.category_pattern = r"#\w+"
+
+    def _raw_with_noise(self, changelog_total=None):
+        raw = make_raw_issue("PROJ-1")
+        histories = raw["changelog"]["histories"]
+        histories.insert(1, {"created": "2024-01-15T11:00:00.000+0000",
+                             "items": [{"field": "description", "fromString": "a", "toString": "b"}]})
+        histories[0]["items"].append({"field": "assignee", "fromString": None, "toString": "someone"})
+        raw["changelog"]["total"] = len(histories) if changelog_total is None else changelog_total
+        return raw
+
+    def test_slim_keeps_only_flagged_and_status_items(self):
+        slim = slim_issue_raw(self._raw_with_noise())
+        histories = slim["changelog"]["histories"]
+        self.assertEqual(len(histories), 2)
+        self.assertEqual([item["field"] for h in histories for item in h["items"]], ["Flagged", "Flagged"])
+        self.assertEqual(slim["changelog"]["total"], 2)
+        self.assertNotIn("labels", slim["fields"])
+        self.assertEqual(slim["fields"]["comment"]["comments"][0]["body"], "Waiting for review")
+
+    def test_slim_issue_processed_like_full_issue(self):
+        jira = unittest.mock.MagicMock()
+        result = process_issue(jira, issue_from_raw(slim_issue_raw(self._raw_with_noise())))
+        jira.issue.assert_not_called()
+        jira._get_json.assert_not_called()
+        self.assertEqual(result[0]["Time Blocked"], 7200)
+
+    def test_truncated_raw_issue_completed_as_raw_json(self):
+        truncated = issue_from_raw(slim_issue_raw(self._raw_with_noise(changelog_total=500)))
+        self.assertEqual(truncated.changelog.total, 499)  # still more than the kept histories
+        jira = make_paging_jira({"issue/PROJ-1/changelog": ("values", self._raw_with_noise()["changelog"]["histories"])})
+        issue = fetch_full_issue(jira, truncated)
+        jira.issue.assert_not_called()
+        self.assertEqual(len(issue.changelog.histories), 2)
+        self.assertTrue(jira_blocker_analyser.is_fully_expanded(issue))
+
+
+def make_paging_jira(lists_by_path, not_found=()):
+    """Jira mock whose _get_json pages through lists of entries: {path: (list name, entries)}."""
+    def get_json(path, params=None):
+        if path in not_found:
+            raise JiraErrorStub(404)
+        list_name, entries = lists_by_path[path]
+        start_at, max_results = params["startAt"], params["maxResults"]
+        return {"startAt": start_at, "maxResults": max_results, "total": len(entries),
+                list_name: entries[start_at:start_at + max_results]}
+
+    jira = unittest.mock.MagicMock()
+    jira._get_json.side_effect = get_json
+    return jira
+
+
+def flag_history(created, to_string=None, from_string=None):
+    return {"created": created, "items": [{"field": "Flagged", "fromString": from_string, "toString": to_string}]}
+
+
+class TestPaginatedHistory(unittest.TestCase):
+    def setUp(self):
+        jira_blocker_analyser.category_pattern = r"#\w+"
+        patcher = unittest.mock.patch.multiple(jira_blocker_analyser, CHANGELOG_PAGE_SIZE=2, COMMENT_PAGE_SIZE=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _histories(self):
+        return [
+            {"created": "2024-01-10T09:00:00.000+0000", "items": [{"field": "summary", "fromString": "a", "toString": "b"}]},
+            flag_history("2024-01-15T10:00:00.000+0000", to_string="Impediment"),
+            flag_history("2024-01-15T12:00:00.000+0000", from_string="Impediment"),
+            flag_history("2024-02-01T10:00:00.000+0000", to_string="Impediment"),
+            flag_history("2024-02-02T10:00:00.000+0000", from_string="Impediment"),
+        ]
+
+    def _comments(self):
+        return [{"id": str(i), "created": f"2024-0{month}-{day:02d}T11:00:00.000+0000", "body": f"c{i}"}
+                for i, (month, day) in enumerate([(1, 15), (1, 20), (2, 1), (2, 5), (2, 6), (3, 1)])]
+
+    def _truncated_issue(self):
+        raw = {"key": "PROJ-9", "fields": {"summary": "Long lived",
+                                           "comment": {"startAt": 0, "maxResults": 1, "total": 6,
+                                                       "comments": self._comments()[:1]}},
+               "changelog": {"startAt": 0, "maxResults": 2, "total": 5, "histories": self._histories()[:2]}}
+        return issue_from_raw(slim_issue_raw(raw))
+
+    def test_all_flag_cycles_found_through_changelog_pages(self):
+        jira = make_paging_jira({
+            "issue/PROJ-9/changelog": ("values", self._histories()),
+            "issue/PROJ-9/comment": ("comments", self._comments()),
+        })
+        result = process_issue(jira, self._truncated_issue())
+        self.assertEqual([r["Flag Set Time"] for r in result], ["2024-01-15 10:00", "2024-02-01 10:00"])
+        self.assertEqual(result[1]["Comments"], "c2\n---\n")
+
+    def test_comment_paging_stops_after_last_flag_change(self):
+        jira = make_paging_jira({
+            "issue/PROJ-9/changelog": ("values", self._histories()),
+            "issue/PROJ-9/comment": ("comments", self._comments()),
+        })
+        fetch_full_issue(jira, self._truncated_issue())
+        comment_pages = [c for c in jira._get_json.call_args_list if c.args[0] == "issue/PROJ-9/comment"]
+        # comments of 2024-02-05 and later are after the last flag removal: the third page is never requested
+        self.assertEqual([c.kwargs["params"]["startAt"] for c in comment_pages], [0, 2])
+
+    def test_server_without_changelog_endpoint_falls_back_to_expanded_issue(self):
+        jira = make_paging_jira({"issue/PROJ-9/comment": ("comments", self._comments())},
+                                not_found=("issue/PROJ-9/changelog",))
+        original_get_json = jira._get_json.side_effect
+
+        def get_json(path, params=None):
+            if path == "issue/PROJ-9":
+                return {"key": "PROJ-9", "changelog": {"histories": self._histories()}}
+            return original_get_json(path, params)
+
+        jira._get_json.side_effect = get_json
+        result = process_issue(jira, self._truncated_issue())
+        self.assertEqual(len(result), 2)
+
+    def test_thin_search_hit_gets_its_summary(self):
+        # --cache-dir searches only 'updated'; an issue missing from the key search is completed by process_issue
+        jira = make_paging_jira({
+            "issue/PROJ-9/changelog": ("values", self._histories()),
+            "issue/PROJ-9/comment": ("comments", self._comments()),
+        })
+        original_get_json = jira._get_json.side_effect
+
+        def get_json(path, params=None):
+            if path == "issue/PROJ-9":
+                self.assertEqual(params, {"fields": "summary"})
+                return {"key": "PROJ-9", "fields": {"summary": "Long lived"}}
+            return original_get_json(path, params)
+
+        jira._get_json.side_effect = get_json
+        thin = issue_from_raw(slim_issue_raw({"key": "PROJ-9", "fields": {"updated": "2024-03-01T10:00:00.000+0000"}}))
+        result = process_issue(jira, thin)
+        self.assertEqual([r["Issue Summary"] for r in result], ["Long lived", "Long lived"])
+
+    def test_summary_of_server_fallback_is_kept(self):
+        jira = make_paging_jira({"issue/PROJ-9/comment": ("comments", self._comments())},
+                                not_found=("issue/PROJ-9/changelog",))
+        original_get_json = jira._get_json.side_effect
+
+        def get_json(path, params=None):
+            if path == "issue/PROJ-9":
+                return {"key": "PROJ-9", "fields": {"summary": "Long lived"}, "changelog": {"histories": self._histories()}}
+            return original_get_json(path, params)
+
+        jira._get_json.side_effect = get_json
+        thin = issue_from_raw(slim_issue_raw({"key": "PROJ-9", "fields": {"updated": "2024-03-01T10:00:00.000+0000"}}))
+        self.assertEqual(process_issue(jira, thin)[0]["Issue Summary"], "Long lived")
+        self.assertEqual(len([c for c in jira._get_json.call_args_list if c.args[0] == "issue/PROJ-9"]), 1)
+
+
+class TestOfflineInput(unittest.TestCase):
+    def setUp(self):
+        jira_blocker_analyser.category_pattern = r"#\w+"
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def keys(self, path, workers=1):
+        return [raw["key"] for raw in read_issue_file(path, workers)]
+
+    def test_stream_reads_values_split_across_small_buffers(self):
+        text = json.dumps({"startAt": 0, "total": 12345, "issues": [make_raw_issue(f"PROJ-{i}") for i in range(3)]})
+        issues = list(JsonStream(io.StringIO(text), buffer_size=7).issues())
+        self.assertEqual([raw["key"] for raw in issues], ["PROJ-0", "PROJ-1", "PROJ-2"])
+        self.assertEqual(issues[0], make_raw_issue("PROJ-0"))
+
+    def test_export_formats(self):
+        raws = [make_raw_issue("PROJ-1"), make_raw_issue("PROJ-2")]
+        array = self.write("array.json", json.dumps(raws, indent=2))
+        response = self.write("response.json", json.dumps({"expand": "names", "issues": raws, "total": 2}, indent=1))
+        lines = self.write("dump.json", "\n".join(json.dumps(raw) for raw in raws))
+        empty = self.write("empty.json", '{"issues": []}')
+        for path in (array, response, lines):
+            self.assertEqual(self.keys(path), ["PROJ-1", "PROJ-2"])
+        self.assertEqual(self.keys(empty), [])
+        self.assertNotIn("labels", next(read_issue_file(array))["fields"])
+
+    def test_ndjson_chunks_end_at_line_breaks(self):
+        path = self.write("dump.ndjson", "".join(json.dumps(make_raw_issue(f"PROJ-{i}")) + "\n" for i in range(10)))
+        chunks = list(ndjson_chunks(path, chunk_size=1000))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], os.path.getsize(path))
+        self.assertTrue(all(end == start for (_, end), (start, _) in zip(chunks, chunks[1:])))
+        with unittest.mock.patch.object(jira_blocker_analyser, "INPUT_CHUNK_SIZE", 1000):
+            self.assertEqual(self.keys(path), [f"PROJ-{i}" for i in range(10)])
+        self.assertEqual(list(ndjson_chunks(self.write("empty.ndjson", ""))), [])
+
+    def test_ndjson_parsed_by_processes_in_file_order(self):
+        path = self.write("dump.jsonl", "".join(json.dumps(make_raw_issue(f"PROJ-{i}")) + "\n\n" for i in range(20)))
+        with unittest.mock.patch.object(jira_blocker_analyser, "INPUT_CHUNK_SIZE", 500):
+            self.assertEqual(self.keys(path, workers=3), [f"PROJ-{i}" for i in range(20)])
+
+    def test_offline_issues_processed_without_client(self):
+        raw = make_raw_issue("PROJ-1")
+        raw["fields"]["comment"]["total"] = 5  # truncated in the export, analysed as it is
+        bare = {"key": "PROJ-2", "fields": {"summary": "Not expanded"}}
+        path = self.write("export.json", json.dumps([raw, bare]))
+        results = [process_issue(None, issue) for issue in offline_issues(path)]
+        self.assertEqual([len(blockers) for blockers in results], [1, 0])
+        self.assertEqual(results[0][0].seconds, 7200)
+        self.assertIn("Waiting for review", results[0][0]["Comments"])
+
+    def test_offline_issues_exported_without_summary(self):
+        raw = make_raw_issue("PROJ-1")
+        del raw["fields"]["summary"]  # exported with fields=comment&expand=changelog
+        (issue,) = offline_issues(self.write("export.json", json.dumps([raw])))
+        (blocker,) = process_issue(None, issue)
+        self.assertEqual((blocker.issue_key, blocker.issue_summary, blocker.seconds), ("PROJ-1", "", 7200))
+
+
+class TestTargets(unittest.TestCase):
+    def test_targets_for_project_and_team_combinations(self):
+        targets = make_targets("type = Bug", ["A", "B"], ["X"])
+        self.assertEqual([t.name for t in targets], ["A / X", "B / X"])
+        self.assertEqual(targets[1].base_query, "type = Bug and project = B and Team = X")
+        (single,) = make_targets(None, ["A"], [])
+        self.assertEqual((single.name, single.base_query, single.team), ("A", "project = A", None))
+        self.assertEqual(make_targets()[0].base_query, "")
+
+    def test_targets_from_entries_add_common_jql(self):
+        targets = make_targets("type = Bug", entries=[{"name": "Ops", "jql": "labels = ops"}, {"project": "A"}])
+        self.assertEqual([(t.name, t.base_query) for t in targets],
+                         [("Ops", "type = Bug and labels = ops"), ("A", "type = Bug and project = A")])
+
+    @unittest.skipUnless(importlib.util.find_spec("yaml"), "PyYAML is not installed")
+    def test_load_targets_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "targets.yaml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("targets:\n  - project: A\n    team: X\n  - name: Ops\n    jql: labels = ops\n")
+            self.assertEqual(load_targets(path), [{"project": "A", "team": "X"}, {"name": "Ops", "jql": "labels = ops"}])
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("- projekt: A\n")
+            with self.assertRaises(ValueError):
+                load_targets(path)
+
+    def test_search_targets_deduplicates_within_target_only(self):
+        targets = make_targets(None, ["A", "B"])
+        targets[0].queries = ["a1", "a2"]
+        targets[1].queries = ["b1"]
+        jira = make_search_jira({"a1": ["A-1", "X-1"], "a2": ["X-1", "A-2"], "b1": ["X-1"]})
+        pairs = list(search_targets(jira, targets, page_size=10, workers=3))
+        self.assertEqual([(target.name, issue.key) for target, issue in pairs],
+                         [("A", "A-1"), ("A", "X-1"), ("A", "A-2"), ("B", "X-1")])
+
+    def test_paired_keeps_tags_through_issue_stream(self):
+        pairs = [("A", 1), ("A", 2), ("B", 3)]
+        self.assertEqual(list(paired(lambda issues: (issue * 10 for issue in issues), iter(pairs))),
+                         [("A", 10), ("A", 20), ("B", 30)])
+
+    def test_csv_has_project_and_team_columns(self):
+        blocker = make_blocker()
+        blocker.project, blocker.team = "A", "X"
+        with tempfile.TemporaryDirectory() as tmp:
+            with unittest.mock.patch.object(jira_blocker_analyser, "target_columns", True):
+                with CsvWriter(os.path.join(tmp, "blockers"), "hours") as writer:
+                    writer.write(blocker)
+            (name,) = os.listdir(tmp)
+            with open(os.path.join(tmp, name), newline="") as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(rows[0][:3], ["Project", "Team", "Issue Key"])
+        self.assertEqual(rows[1][:3], ["A", "X", "PROJ-1"])
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "journal.ndjson")
+        self.target = Target("A / X", "project = A", "A", "X")
+
+    def test_blocker_round_trip_keeps_interval_comments(self):
+        blocker = make_blocker()
+        blocker.comments = CommentIndex([make_comment("2024-01-15T10:30:00.000+0000", "During"),
+                                         make_comment("2024-01-16T10:00:00.000+0000", "Later")])
+        blocker.project, blocker.working_seconds = "A", 3600.0
+        restored = blocker_from_json(json.loads(json.dumps(blocker_to_json(blocker))))
+        self.assertEqual(restored.to_dict(), blocker.to_dict())
+        self.assertEqual(restored["Comments"], "During\n---\n")
+        self.assertEqual((restored.project, restored.working_seconds), ("A", 3600.0))
+
+    def test_resume_drops_torn_last_line(self):
+        with Journal(self.path) as journal:
+            journal.record(self.target, "PROJ-1", [make_blocker("PROJ-1")])
+            journal.record(self.target, "PROJ-2", [])
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"target": "A / X", "key": "PROJ-3", "blo')
+        with Journal(self.path, resume=True) as journal:
+            self.assertEqual(sorted(journal.done), [("A / X", "PROJ-1"), ("A / X", "PROJ-2")])
+            self.assertEqual(journal.done[("A / X", "PROJ-1")][0].seconds, 7200)
+            journal.record(self.target, "PROJ-3", [])
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["key"] for line in f], ["PROJ-1", "PROJ-2", "PROJ-3"])
+
+    def test_new_journal_replaces_old_one(self):
+        with Journal(self.path) as journal:
+            journal.record(self.target, "PROJ-1", [])
+        with Journal(self.path) as journal:
+            self.assertEqual(journal.done, {})
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_merge_processes_only_missing_issues_in_order(self):
+        issues = [SimpleNamespace(key=f"PROJ-{i}") for i in range(1, 6)]
+        done = {("A / X", "PROJ-1"): ["j1"], ("A / X", "PROJ-3"): [], ("A / X", "PROJ-5"): ["j5"]}
+        processed = []
+
+        def process(pairs):
+            for target, issue in pairs:
+                processed.append(issue.key)
+                yield target, [issue.key.lower()]
+
+        results = list(merge_journal(((self.target, issue) for issue in issues), done, process))
+        self.assertEqual(processed, ["PROJ-2", "PROJ-4"])
+        self.assertEqual([(key, blockers, journaled) for _, key, blockers, journaled in results], [
+            ("PROJ-1", ["j1"], True), ("PROJ-2", ["proj-2"], False), ("PROJ-3", [], True),
+            ("PROJ-4", ["proj-4"], False), ("PROJ-5", ["j5"], True),
+        ])
+
+
+class TestStreaming(unittest.TestCase):
+    def test_ordered_map_consumes_input_lazily(self):
+        consumed = []
+
+        def items():
+            for i in itertools.count():
+                consumed.append(i)
+                yield i
+
+        results = list(itertools.islice(ordered_map(lambda x: x * 10, items(), workers=3), 5))
+        self.assertEqual(results, [0, 10, 20, 30, 40])
+        self.assertLessEqual(len(consumed), 5 + 2 * 3)
+
+    def test_ordered_map_single_worker(self):
+        self.assertEqual(list(ordered_map(str, [1, 2, 3], workers=1)), ["1", "2", "3"])
+
+    def test_batched(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(batched([], 2)), [])
+
+
+def make_blocker(key="PROJ-1", seconds=7200, category="#infra", not_removed=False):
+    """BlockerRecord flagged at 2024-01-15 10:00 UTC for the given number of seconds."""
+    flag_set = datetime(2024, 1, 15, 10, 0, 0, tzinfo=timezone.utc)
+    comments = CommentIndex([make_comment("2024-01-15T10:00:00.000+0000", "Waiting")])
+    return BlockerRecord(key, "Blocked task", flag_set, flag_set + timedelta(seconds=seconds), seconds, category,
+                         comments, not_removed)
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output_file = os.path.join(tmp.name, "blockers")
+
+    def test_csv_rows_written_before_close_with_display_time(self):
+        writer = CsvWriter(self.output_file, "hours")
+        with unittest.mock.patch.object(jira_blocker_analyser, "FLUSH_EVERY", 2):
+            writer.write(make_blocker("PROJ-1"))
+            writer.write(make_blocker("PROJ-2", seconds=5400))
+            with open(writer.csvfile.name, newline="") as f:
+                rows = list(csv.DictReader(f))
+        writer.close()
+        self.assertEqual([r["Issue Key"] for r in rows], ["PROJ-1", "PROJ-2"])
+        self.assertEqual(rows[1]["Time Blocked"], "1.5")
+        self.assertEqual(rows[1]["Time Unit"], "hours")
+
+    def test_print_writer_outputs_blocker(self):
+        out = io.StringIO()
+        with unittest.mock.patch("sys.stdout", out):
+            with PrintWriter(self.output_file, "days") as writer:
+                writer.write(make_blocker(not_removed=True))
+        text = out.getvalue()
+        self.assertIn(">>> Issue: PROJ-1 - Blocked task <<<", text)
+        self.assertIn("Time blocked (days): 0.1", text)
+        self.assertIn("Flag was not removed!!!", text)
+        self.assertIn("Blocker category: #infra", text)
+
+
+@unittest.skipUnless(importlib.util.find_spec("openpyxl"), "openpyxl is not installed")
+class TestXlsxWriter(unittest.TestCase):
+    def test_rows_streamed_to_workbook(self):
+        from openpyxl import load_workbook
+        with tempfile.TemporaryDirectory() as tmp:
+            with XlsxWriter(os.path.join(tmp, "blockers"), "hours") as writer:
+                writer.write(make_blocker("PROJ-1"))
+                writer.write(make_blocker("PROJ-2", seconds=5400, not_removed=True))
+            (name,) = os.listdir(tmp)
+            rows = list(load_workbook(os.path.join(tmp, name)).active.values)
+        self.assertEqual(rows[0], tuple(XlsxWriter.columns))
+        self.assertEqual(rows[2][0], "PROJ-2")
+        self.assertEqual(rows[2][4], 1.5)
+        self.assertEqual(rows[2][7], True)
+        self.assertEqual(rows[2][8], "hours")
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestArrowWriters(unittest.TestCase):
+    def _write(self, writer_class):
+        blockers = [make_blocker(f"PROJ-{i}", seconds=3600 * i, category=["#infra", "#vendor", ""][i % 3],
+                                      not_removed=i == 4) for i in range(5)]
+        with tempfile.TemporaryDirectory() as tmp:
+            with unittest.mock.patch.object(jira_blocker_analyser, "ROW_GROUP_SIZE", 2):
+                with writer_class(os.path.join(tmp, "blockers"), "days") as writer:
+                    for blocker_info in blockers:
+                        writer.write(blocker_info)
+            (name,) = os.listdir(tmp)
+            self.assertTrue(name.endswith("." + writer_class.extension))
+            return os.path.join(tmp, name), self._read(writer_class, os.path.join(tmp, name))
+
+    def _read(self, writer_class, path):
+        if writer_class is ParquetWriter:
+            import pyarrow.parquet as pq
+            return pq.read_table(path)
+        import pyarrow.ipc as ipc
+        return ipc.open_file(path).read_all()
+
+    def _check(self, table):
+        import pyarrow as pa
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.schema.field("Flag Set Time").type, pa.timestamp("ms"))
+        self.assertEqual(table.schema.field("Time Blocked").type, pa.float64())
+        self.assertTrue(pa.types.is_dictionary(table.schema.field("Blocker Category").type))
+        self.assertEqual(table.schema.field("Flag was not removed").type, pa.bool_())
+        data = table.to_pydict()
+        self.assertEqual(data["Time Blocked"], [0.0, 3600.0, 7200.0, 10800.0, 14400.0])
+        self.assertEqual(data["Blocker Category"], ["#infra", "#vendor", "", "#infra", "#vendor"])
+        self.assertEqual(data["Flag Set Time"][0], datetime(2024, 1, 15, 10, 0))
+        self.assertEqual(data["Flag was not removed"], [False, False, False, False, True])
+
+    def test_parquet(self):
+        _, table = self._write(ParquetWriter)
+        self._check(table)
+
+    def test_feather(self):
+        _, table = self._write(FeatherWriter)
+        self._check(table)
+
+
+@unittest.skipUnless(importlib.util.find_spec("numpy") and importlib.util.find_spec("pandas"), "numpy and pandas are not installed")
+class TestSummary(unittest.TestCase):
+    def _summary(self, time_unit="hours"):
+        writer = SummaryWriter("unused", time_unit, top=2)
+        for key, seconds, category, not_removed in [
+            ("PROJ-1", 3600, "#infra", False),
+            ("PROJ-1", 7200, "#infra", False),
+            ("PROJ-2", 36000, "#vendor", True),
+            ("PROJ-3", 1800, "", False),
+        ]:
+            writer.write(make_blocker(key, seconds, category, not_removed))
+        import pandas as pd
+        frame = pd.DataFrame(writer.columns)
+        return jira_blocker_analyser.summarize_blockers(frame, time_unit, top=2)
+
+    def test_per_category_aggregates_in_time_unit(self):
+        by_category = self._summary()["by_category"]
+        self.assertEqual(list(by_category.index), ["#vendor", "#infra", "(no category)"])
+        infra = by_category.loc["#infra"]
+        self.assertEqual(infra["Blockers"], 2)
+        self.assertEqual(infra["Total"], 3.0)
+        self.assertEqual(infra["Mean"], 1.5)
+        self.assertEqual(infra["Median"], 1.5)
+        self.assertEqual(infra["P95"], 1.9)  # 3600 + 0.95 * 3600 s = 1.95 h, rounded to one decimal
+
+    def test_top_issues_share_and_histogram(self):
+        summary = self._summary("days")
+        self.assertEqual(summary["unit"], "days")
+        self.assertEqual([key for key, _ in summary["top_issues"].index], ["PROJ-2", "PROJ-1"])
+        self.assertEqual(summary["top_issues"]["Total"].tolist(), [0.4, 0.1])
+        self.assertEqual(summary["not_removed_share"], 0.25)
+        histogram = summary["histogram"]
+        self.assertEqual(histogram["< 1h"], 1)
+        self.assertEqual(histogram["1h - 4h"], 2)
+        self.assertEqual(histogram["4h - 1d"], 1)
+        self.assertEqual(histogram.sum(), 4)
+
+    def test_report_printed_on_close(self):
+        out = io.StringIO()
+        with unittest.mock.patch("sys.stdout", out):
+            with SummaryWriter("unused", "days") as writer:
+                writer.write(make_blocker())
+        self.assertIn("Blocked time per category (days)", out.getvalue())
+        self.assertIn("#infra", out.getvalue())
+
+
+class TestSqliteStore(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output_file = os.path.join(tmp.name, "blockers")
+        self.path = self.output_file + ".sqlite"
+
+    def store(self, *blockers):
+        with SqliteWriter(self.output_file, "days") as writer:
+            for blocker in blockers:
+                writer.write(blocker)
+
+    def blocker(self, key, day, hours, category, project="A"):
+        blocker = make_blocker(key, hours * 3600, category)
+        blocker.flag_set_time = datetime(2024, 1, day, 10, tzinfo=timezone.utc)
+        blocker.flag_removed_time = blocker.flag_set_time + timedelta(hours=hours)
+        blocker.project = project  # --project of the run, the store takes the project from the issue key
+        return blocker
+
+    def test_runs_upsert_by_issue_and_flag_set_time(self):
+        self.store(make_blocker("PROJ-1", 3600), make_blocker("PROJ-2"))
+        self.store(make_blocker("PROJ-1", 7200, "#vendor"))
+        connection = sqlite3.connect(self.path)
+        rows = connection.execute("SELECT issue_key, flag_set_time, seconds, category FROM blockers ORDER BY issue_key").fetchall()
+        connection.close()
+        self.assertEqual(rows, [("PROJ-1", "2024-01-15 10:00:00", 7200, "#vendor"),
+                                ("PROJ-2", "2024-01-15 10:00:00", 7200, "#infra")])
+
+    def test_project_is_taken_from_issue_key(self):
+        self.store(self.blocker("OPS-12", 5, 2, "#infra", project=None))
+        connection = sqlite3.connect(self.path)
+        self.addCleanup(connection.close)
+        self.assertEqual(connection.execute("SELECT project FROM blockers").fetchall(), [("OPS",)])
+        self.assertEqual(store_top(connection, "2024-01-01", projects=["OPS"]), [("OPS-12", "Blocked task", 1, 7200.0)])
+
+    def test_trends_and_top_for_date_range_and_project(self):
+        self.store(self.blocker("PROJ-1", 5, 2, "#infra"), self.blocker("PROJ-1", 6, 4, "#infra"),
+                   self.blocker("PROJ-2", 7, 1, "#vendor"), self.blocker("OPS-1", 8, 10, "#infra"),
+                   self.blocker("PROJ-3", 20, 5, ""))
+        connection = sqlite3.connect(self.path)
+        self.addCleanup(connection.close)
+        self.assertEqual(store_trends(connection, "2024-01-01", "2024-01-10", ["PROJ"]),
+                         [("2024-01", "#infra", 2, 21600.0, 10800.0), ("2024-01", "#vendor", 1, 3600.0, 3600.0)])
+        self.assertEqual(store_top(connection, "2024-01-01", top=2),
+                         [("OPS-1", "Blocked task", 1, 36000.0), ("PROJ-1", "Blocked task", 2, 21600.0)])
+        plan = connection.execute("EXPLAIN QUERY PLAN SELECT count(*) FROM blockers "
+                                  "WHERE flag_set_time >= '2024-01-01' AND category = '#infra'").fetchall()
+        self.assertIn("USING", str(plan))
+
+    def test_print_query_report(self):
+        self.store(self.blocker("PROJ-1", 5, 12, ""))
+        out = io.StringIO()
+        with unittest.mock.patch("sys.stdout", out):
+            print_store_query(self.path, "trends", "days", "2024-01-01")
+        self.assertIn("2024-01  (no category)  1         0.5", out.getvalue())
+        self.assertIn("1 rows from", out.getvalue())
+
+
+def webhook_issue(key, histories, comments=()):
+    """REST JSON of an issue as GET issue/{key}?expand=changelog returns it."""
+    comments = [{"id": str(number), "created": created, "body": body} for number, (created, body) in enumerate(comments)]
+    return {
+        "key": key,
+        "fields": {"summary": f"Summary of {key}",
+                   "comment": {"startAt": 0, "maxResults": 50, "total": len(comments), "comments": comments}},
+        "changelog": {"startAt": 0, "maxResults": 100, "total": len(histories), "histories": histories},
+    }
+
+
+def webhook_payload(event, key, items=(), comment=None):
+    """Jira webhook body, trimmed to the parts the service reads plus some of the noise around them."""
+    payload = {"timestamp": 1705312800000, "webhookEvent": event, "user": {"name": "jdoe"},
+               "issue": {"id": "10001", "key": key, "fields": {"summary": f"Summary of {key}"}}}
+    if items:
+        payload["issue_event_type_name"] = "issue_generic"
+        payload["changelog"] = {"id": "20001", "items": [dict(item, fieldtype="custom") for item in items]}
+    if comment:
+        payload["comment"] = {"id": "30001", "body": comment}
+    return payload
+
+
+FLAG_SET = {"field": "Flagged", "fromString": None, "toString": "Impediment"}
+FLAG_REMOVED = {"field": "Flagged", "fromString": "Impediment", "toString": None}
+
+
+class TestBlockerService(unittest.TestCase):
+    """Recorded webhook payloads replayed against a local --serve instance."""
+
+    def setUp(self):
+        jira_blocker_analyser.category_pattern = r"#\w+"
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "blockers.sqlite")
+        self.issues = {}
+        self.jira = unittest.mock.MagicMock()
+        self.jira._get_json.side_effect = self.get_json
+        patcher = unittest.mock.patch.object(WebhookHandler, "log_message", lambda *args: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = self.start_service()
+
+    def get_json(self, path, params=None):
+        key = path.split("/")[1]
+        if key not in self.issues:
+            raise JiraErrorStub(404)
+        return self.issues[key]
+
+    def start_service(self):
+        service = BlockerService(self.jira, self.path, "hours")
+        server = webhook_server(service, "127.0.0.1:0")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        service.start()
+        self.url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            if service.worker.is_alive():
+                service.stop()
+        self.addCleanup(stop)
+        return service
+
+    def post(self, payload):
+        request = urllib.request.Request(f"{self.url}/webhook", json.dumps(payload).encode(),
+                                         {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            status, body = response.status, json.load(response)
+        self.service.queue.join()
+        return status, body
+
+    def get(self, path):
+        with urllib.request.urlopen(f"{self.url}{path}", timeout=5) as response:
+            return json.load(response)
+
+    def test_replayed_webhooks_maintain_blockers(self):
+        flagged = [flag_history("2024-01-15T10:00:00.000+0000", to_string="Impediment")]
+        comments = [("2024-01-15T10:00:00.000+0000", "(flag) Flag added\n\n#infra broken stand")]
+        self.issues["PROJ-1"] = webhook_issue("PROJ-1", flagged, comments)
+        self.assertEqual(self.post(webhook_payload("jira:issue_updated", "PROJ-1", [FLAG_SET])), (202, {"queued": True}))
+        blocked = self.get("/blocked")["issues"]
+        self.assertEqual([(item["issue_key"], item["category"], item["project"]) for item in blocked],
+                         [("PROJ-1", "#infra", "PROJ")])
+        self.assertEqual(self.get("/blocked?project=OTHER")["issues"], [])
+
+        self.issues["PROJ-1"] = webhook_issue(
+            "PROJ-1", flagged + [flag_history("2024-01-15T16:00:00.000+0000", from_string="Impediment")], comments)
+        self.post(webhook_payload("jira:issue_updated", "PROJ-1", [FLAG_REMOVED]))
+        self.assertEqual(self.get("/blocked")["issues"], [])
+        report = self.get("/report?query=top&from=2024-01-01")
+        self.assertEqual(report, {"time_unit": "hours", "rows": [
+            {"issue_key": "PROJ-1", "issue_summary": "Summary of PROJ-1", "blockers": 1, "total": 6.0}]})
+        self.assertEqual(self.get("/report?query=trends&from=2024-01-01&until=2024-02-01")["rows"][0]["category"], "#infra")
+
+        # a comment on a tracked issue refreshes it, a change of an issue never flagged is not even fetched
+        self.assertEqual(self.post(webhook_payload("comment_created", "PROJ-1", comment="done"))[0], 202)
+        self.issues["PROJ-2"] = webhook_issue("PROJ-2", [])
+        self.assertEqual(self.post(webhook_payload("jira:issue_updated", "PROJ-2", [{"field": "assignee"}])),
+                         (200, {"queued": False}))
+        self.assertEqual(self.jira._get_json.call_count, 3)
+
+        del self.issues["PROJ-1"]
+        self.post(webhook_payload("jira:issue_deleted", "PROJ-1"))
+        self.assertEqual(self.get("/report?query=top&from=2024-01-01")["rows"], [])
+        self.assertEqual(self.get("/status")["webhooks"], {"queued": 4, "ignored": 1, "fetched": 3,
+                                                           "pending": 0, "blocked": 0, "tracked": 0})
+
+    def test_events_of_one_issue_are_coalesced(self):
+        self.service.stop()
+        self.service = BlockerService(self.jira, self.path, "days")
+        self.issues["PROJ-1"] = webhook_issue("PROJ-1", [flag_history("2024-01-15T10:00:00.000+0000", to_string="Impediment")])
+        for _ in range(3):
+            self.assertTrue(self.service.submit(webhook_payload("jira:issue_updated", "PROJ-1", [FLAG_SET])))
+        self.service.start()
+        self.service.queue.join()
+        self.assertEqual(self.jira._get_json.call_count, 1)
+        self.assertEqual(list(self.service.blocked), ["PROJ-1"])
+
+    def test_open_blockers_survive_a_restart(self):
+        self.issues["PROJ-1"] = webhook_issue("PROJ-1", [flag_history("2024-01-15T10:00:00.000+0000", to_string="Impediment")])
+        self.post(webhook_payload("jira:issue_updated", "PROJ-1", [FLAG_SET]))
+        self.service.stop()
+        self.service = self.start_service()
+        blocked = self.get("/blocked")["issues"]
+        self.assertEqual([(item["issue_key"], item["flag_set_time"]) for item in blocked],
+                         [("PROJ-1", "2024-01-15T10:00:00+00:00")])
+        self.assertGreater(blocked[0]["blocked"], 24)  # hours so far
+
+    def test_flag_left_on_a_resolved_issue_is_stored_as_by_sqlite_mode(self):
+        histories = [flag_history("2024-01-15T10:00:00.000+0000", to_string="Impediment"),
+                     {"created": "2024-01-15T14:00:00.000+0000",
+                      "items": [{"field": "status", "fromString": "In Progress", "toString": "Done"}]}]
+        self.issues["PROJ-1"] = webhook_issue("PROJ-1", histories)
+        self.post(webhook_payload("jira:issue_updated", "PROJ-1", [{"field": "status"}, FLAG_SET]))
+        self.assertEqual(self.get("/blocked")["issues"], [])
+        connection = sqlite3.connect(self.path)
+        served = connection.execute("SELECT * FROM blockers").fetchall()
+        connection.close()
+
+        self.service.stop()
+        os.remove(self.path)
+        blockers = process_issue(None, issue_from_raw(slim_issue_raw(self.issues["PROJ-1"])))
+        with SqliteWriter(self.path[:-len(".sqlite")], "hours") as writer:
+            for blocker in blockers:
+                writer.write(blocker)
+        connection = sqlite3.connect(self.path)
+        stored = connection.execute("SELECT * FROM blockers").fetchall()
+        connection.close()
+        self.assertEqual([row[:-1] for row in served], [row[:-1] for row in stored])  # all but stored_at
+        self.assertEqual(served[0][:3] + (served[0][8],), ("PROJ-1", "2024-01-15 10:00:00", "2024-01-15 14:00:00", 1))
+
+    def test_bad_requests(self):
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            urllib.request.urlopen(urllib.request.Request(f"{self.url}/webhook", b"not json"), timeout=5)
+        self.assertEqual(raised.exception.code, 400)
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            self.get("/report?query=everything")
+        self.assertEqual(raised.exception.code, 400)
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            self.get("/report?query=top&top=ten")
+        self.assertEqual(raised.exception.code, 400)
+        self.assertEqual(self.post({"webhookEvent": "sprint_started"}), (200, {"queued": False}))
+
+
+def utc(day, hour=0):
+    return datetime(2024, 1, day, hour, tzinfo=timezone.utc)
+
+
+class TestTimeline(unittest.TestCase):
+    def test_daily_series_counts_overlapping_blockers_per_category(self):
+        timeline = blocked_timeline([
+            (utc(1, 10), utc(3, 10), "#infra"),
+            (utc(2, 9), utc(2, 18), "#infra"),
+            (utc(2, 12), utc(4, 12), "#vendor"),
+        ], timedelta(days=1))
+        self.assertEqual(timeline["periods"], [utc(1), utc(2), utc(3), utc(4)])
+        self.assertEqual(timeline["series"]["#infra"], [1, 2, 1, 0])
+        self.assertEqual(timeline["series"]["#vendor"], [0, 1, 1, 1])
+        self.assertEqual(timeline["totals"], [1, 3, 2, 1])
+        self.assertEqual(timeline["peak"], 3)
+        self.assertEqual(timeline["peak_windows"], [(utc(2, 12), utc(2, 18))])
+
+    def test_blocker_removed_when_another_is_set_is_not_concurrent(self):
+        timeline = blocked_timeline([
+            (utc(1, 10), utc(1, 12), "#a"),
+            (utc(1, 12), utc(1, 14), "#a"),
+        ], timedelta(hours=1))
+        self.assertEqual(timeline["peak"], 1)
+        self.assertEqual(timeline["peak_windows"], [(utc(1, 10), utc(1, 14))])
+        self.assertEqual(timeline["periods"][0], utc(1, 10))
+        self.assertEqual(len(timeline["periods"]), 5)  # 10:00 ... 14:00
+
+    def test_separate_peak_windows(self):
+        timeline = blocked_timeline([
+            (utc(1, 0), utc(1, 5), "#a"),
+            (utc(1, 1), utc(1, 2), "#b"),
+            (utc(1, 3), utc(1, 4), "#b"),
+        ], timedelta(days=1))
+        self.assertEqual(timeline["peak"], 2)
+        self.assertEqual(timeline["peak_windows"], [(utc(1, 1), utc(1, 2)), (utc(1, 3), utc(1, 4))])
+
+    def test_blocker_removed_at_period_start_is_not_counted_in_it(self):
+        timeline = blocked_timeline([(utc(2, 22), utc(4), "#a"), (utc(3, 5), utc(5), "#b")], timedelta(days=1))
+        self.assertEqual(timeline["periods"], [utc(2), utc(3), utc(4), utc(5)])
+        self.assertEqual(timeline["series"]["#a"], [1, 1, 0, 0])
+        self.assertEqual(timeline["series"]["#b"], [0, 1, 1, 0])
+        self.assertEqual(timeline["totals"], [1, 2, 1, 0])
+
+    def test_series_match_counting_at_every_flag_set(self):
+        rng = random.Random(7)
+        intervals = []
+        for _ in range(60):
+            start = utc(1) + timedelta(hours=rng.randrange(0, 24 * 6, 2))
+            intervals.append((start, start + timedelta(hours=rng.choice([1, 2, 6, 22, 24, 48])), rng.choice("ab")))
+        step = timedelta(days=1)
+        timeline = blocked_timeline(intervals, step)
+        for index, period in enumerate(timeline["periods"]):
+            # the most blockers open in a period are open at its start or when one of them is set
+            moments = [period] + [start for start, _, _ in intervals if period <= start < period + step]
+            for category in "ab":
+                expected = max(sum(1 for start, end, c in intervals if c == category and start <= moment < end)
+                               for moment in moments)
+                self.assertEqual(timeline["series"][category][index], expected, (period, category))
+            expected = max(sum(1 for start, end, _ in intervals if start <= moment < end) for moment in moments)
+            self.assertEqual(timeline["totals"][index], expected, period)
+
+    def test_naive_and_aware_times_mixed_and_empty_input(self):
+        timeline = blocked_timeline([(datetime(2024, 1, 1, 10), utc(1, 11), "#a")], timedelta(hours=1))
+        self.assertEqual(timeline["peak_windows"], [(utc(1, 10), utc(1, 11))])
+        self.assertEqual(blocked_timeline([], timedelta(days=1))["periods"], [])
+
+    def test_writer_saves_series_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = io.StringIO()
+            with unittest.mock.patch("sys.stdout", out):
+                with TimelineWriter(os.path.join(tmp, "blockers"), "hours", step="day") as writer:
+                    writer.write(make_blocker("PROJ-1", 7200, "#infra"))
+                    writer.write(make_blocker("PROJ-2", 3600, ""))
+            (name,) = os.listdir(tmp)
+            with open(os.path.join(tmp, name), newline="") as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(rows, [["Period", "Total", "#infra", "(no category)"], ["2024-01-15", "2", "1", "1"]])
+        self.assertIn("Peak: 2 issues blocked at the same time", out.getvalue())
+        self.assertIn("2024-01-15 10:00 - 2024-01-15 11:00 UTC (1.0 hours)", out.getvalue())
+
+
+@unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy is not installed")
+class TestWorkingCalendar(unittest.TestCase):
+    # 2024-01-01 is Monday; working hours 9-18 (9 hours a day)
+    def hours(self, start, end, holidays=()):
+        (seconds,) = WorkingCalendar(holidays).working_seconds([start], [end])
+        return seconds / 3600
+
+    def test_same_day_clipped_to_working_hours(self):
+        self.assertEqual(self.hours(utc(1, 10), utc(1, 12)), 2)
+        self.assertEqual(self.hours(utc(1, 7), utc(1, 20)), 9)
+        self.assertEqual(self.hours(utc(1, 19), utc(1, 23)), 0)
+
+    def test_overnight_and_weekend(self):
+        self.assertEqual(self.hours(utc(1, 17), utc(2, 10)), 2)
+        self.assertEqual(self.hours(utc(5, 17), utc(8, 10)), 2)  # Friday to Monday
+        self.assertEqual(self.hours(utc(6, 10), utc(7, 15)), 0)  # Saturday to Sunday
+        self.assertEqual(self.hours(utc(1, 9), utc(15, 9)), 90)  # two full weeks
+
+    def test_holidays_and_empty_interval(self):
+        self.assertEqual(self.hours(utc(1, 17), utc(3, 10), holidays=[date(2024, 1, 2)]), 2)
+        self.assertEqual(self.hours(utc(2, 10), utc(2, 10)), 0)
+        self.assertEqual(self.hours(utc(2, 12), utc(2, 10)), 0)
+
+    def test_load_holidays_skips_comments(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "holidays.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("# New year\n2024-01-01\n\n2024-01-02 second day\n")
+            self.assertEqual(load_holidays(path), [date(2024, 1, 1), date(2024, 1, 2)])
+
+    def test_process_issue_sets_working_time_and_csv_column(self):
+        jira_blocker_analyser.category_pattern = r"#\w+"
+        histories = [
+            make_history("2024-01-05T17:00:00.000000+0000", [make_changelog_item("Flagged", to_string="Impediment")]),
+            make_history("2024-01-08T10:00:00.000000+0000", [
+                make_changelog_item("Flagged", from_string="Impediment", to_string=None),
+            ]),
+        ]
+        issue = make_expanded_issue("PROJ-1", "Summary", histories)
+        with unittest.mock.patch.object(jira_blocker_analyser, "working_calendar", WorkingCalendar()):
+            (blocker,) = process_issue(None, issue)
+            with tempfile.TemporaryDirectory() as tmp:
+                with CsvWriter(os.path.join(tmp, "blockers"), "hours") as writer:
+                    writer.write(blocker)
+                (name,) = os.listdir(tmp)
+                with open(os.path.join(tmp, name), newline="") as f:
+                    rows = list(csv.DictReader(f))
+        self.assertEqual(blocker.seconds, 65 * 3600)
+        self.assertEqual(blocker.working_seconds, 2 * 3600)
+        self.assertEqual(rows[0]["Time Blocked"], "65.0")
+        self.assertEqual(rows[0]["Working Time Blocked"], "2.0")
+
+
+class JiraErrorStub(Exception):
+    """Exception shaped like jira.JIRAError: status_code and response with headers."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = unittest.mock.MagicMock()
+        self.response.headers = headers or {}
+
+
+class StubJiraHandler(http.server.BaseHTTPRequestHandler):
+    """Local stand-in for Jira: /flaky/<n> fails with 503 n times, /throttled always answers 429 with Retry-After,
+    /slow/<n> stalls on the first n requests,
+    /data returns a large JSON body, gzip-compressed if the client accepts it."""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    hits = Counter()
+    connections = set()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"{}", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.connections.add(self.client_address)
+        _, kind, *rest = self.path.split("/")
+        self.hits[self.path] += 1
+        if kind == "flaky" and self.hits[self.path] <= int(rest[0]):
+            return self._send(503)
+        if kind == "throttled":
+            return self._send(429, headers=[("Retry-After", "0")])
+        if kind == "slow" and self.hits[self.path] <= int(rest[0]):
+            time.sleep(0.5)
+        if kind == "data":
+            body = json.dumps({"values": ["history entry"] * 10000}).encode()
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                return self._send(200, gzip.compress(body), [("Content-Encoding", "gzip")])
+            return self._send(200, body)
+        self._send(200, json.dumps({"path": self.path}).encode())
+
+    do_POST = do_GET
+
+
+@unittest.skipUnless(importlib.util.find_spec("requests"), "requests is not installed")
+class TestTransport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubJiraHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        import requests
+        StubJiraHandler.hits.clear()
+        StubJiraHandler.connections.clear()
+        self.session = configure_session(requests.Session(), pool_size=2, retries=3, backoff_factor=0.01)
+        self.addCleanup(self.session.close)
+
+    def test_get_retried_on_server_errors(self):
+        response = self.session.get(f"{self.url}/flaky/2", timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StubJiraHandler.hits["/flaky/2"], 3)
+
+    def test_gives_up_with_last_error_response(self):
+        response = self.session.get(f"{self.url}/flaky/10", timeout=5)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(StubJiraHandler.hits["/flaky/10"], 4)
+
+    def test_throttling_is_left_to_call_with_retry(self):
+        response = self.session.get(f"{self.url}/throttled", timeout=5)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(StubJiraHandler.hits["/throttled"], 1)
+
+    def test_post_is_not_retried(self):
+        response = self.session.post(f"{self.url}/flaky/1", timeout=5)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(StubJiraHandler.hits["/flaky/1"], 1)
+
+    def test_read_timeout_retried(self):
+        response = self.session.get(f"{self.url}/slow/1", timeout=0.2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StubJiraHandler.hits["/slow/1"], 2)
+
+    def test_compressed_response_decoded(self):
+        response = self.session.get(f"{self.url}/data", timeout=5)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(response.json()["values"]), 10000)
+        self.assertLess(int(response.headers["Content-Length"]), len(response.content) // 10)
+
+    def test_concurrent_requests_share_pooled_connections(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(lambda i: self.session.get(f"{self.url}/ok/{i}", timeout=5).status_code, range(40)))
+        self.assertEqual(statuses, [200] * 40)
+        self.assertLessEqual(len(StubJiraHandler.connections), 2)
+
+
+class TestCallWithRetry(unittest.TestCase):
+    def setUp(self):
+        self.limiter = RateLimiter(base_delay=0.5, max_delay=4)
+        patcher = unittest.mock.patch.object(jira_blocker_analyser, "rate_limiter", self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sleep_patcher = unittest.mock.patch.object(jira_blocker_analyser.time, "sleep")
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def test_returns_result_without_retry(self):
+        func = unittest.mock.MagicMock(return_value="ok")
+        self.assertEqual(call_with_retry(func, "A", expand="changelog"), "ok")
+        func.assert_called_once_with("A", expand="changelog")
+
+    def test_retries_on_429_honoring_retry_after(self):
+        func = unittest.mock.MagicMock(side_effect=[JiraErrorStub(429, {"Retry-After": "3"}), "ok"])
+        self.assertEqual(call_with_retry(func), "ok")
+        self.assertEqual(func.call_count, 2)
+        self.assertAlmostEqual(self.sleep.call_args[0][0], 3, delta=0.1)
+
+    def test_backoff_grows_without_retry_after(self):
+        self.assertEqual(self.limiter.throttled(), 0.5)
+        self.assertEqual(self.limiter.throttled(), 1.0)
+        self.assertEqual(self.limiter.throttled(), 2.0)
+        self.limiter.succeeded()
+        self.assertEqual(self.limiter.throttled(), 2.0)
+
+    def test_other_errors_are_not_retried(self):
+        func = unittest.mock.MagicMock(side_effect=JiraErrorStub(500))
+        with self.assertRaises(JiraErrorStub):
+            call_with_retry(func)
+        func.assert_called_once()
+
+    def test_gives_up_after_max_retries(self):
+        func = unittest.mock.MagicMock(side_effect=JiraErrorStub(429))
+        with self.assertRaises(JiraErrorStub):
+            call_with_retry(func, max_retries=2)
+        self.assertEqual(func.call_count, 3)
+
+
+def make_response(method, url, content=b"{}", status_code=200, elapsed=0.2):
+    """requests.Response as seen by a response hook."""
+    response = unittest.mock.MagicMock()
+    response.request.method = method
+    response.request.url = url
+    response.content = content
+    response.status_code = status_code
+    response.elapsed = timedelta(seconds=elapsed)
+    return response
+
+
+class TestRunMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = RunMetrics()
+        patcher = unittest.mock.patch.object(jira_blocker_analyser, "metrics", self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_phase_times_accumulate(self):
+        for _ in range(2):
+            with self.metrics.phase("extract"):
+                time.sleep(0.01)
+        phase = self.metrics.report()["phases"]["extract"]
+        self.assertEqual(phase["calls"], 2)
+        self.assertGreaterEqual(phase["wall"], 0.02)
+        self.assertLess(phase["cpu"], phase["wall"])
+
+    def test_response_hook_counts_per_endpoint_and_latency(self):
+        jira = unittest.mock.MagicMock()
+        jira._session.hooks = {"response": []}
+        self.metrics.install(jira)
+        hook = jira._session.hooks["response"][0]
+        hook(make_response("GET", "https://jira/rest/api/2/issue/PROJ-1/changelog?startAt=0", b"x" * 100))
+        hook(make_response("GET", "https://jira/rest/api/2/issue/PROJ-22/changelog?startAt=100", b"x" * 50, elapsed=3))
+        hook(make_response("GET", "https://jira/rest/api/2/search?jql=x", status_code=429, elapsed=0.01))
+        report = self.metrics.report()
+        self.assertEqual(report["endpoints"]["GET /rest/api/2/issue/{key}/changelog"],
+                         {"requests": 2, "bytes": 150, "errors": 0})
+        self.assertEqual(report["endpoints"]["GET /rest/api/2/search"]["errors"], 1)
+        self.assertEqual(report["requests"], 3)
+        self.assertEqual(report["latency_histogram"]["<= 0.05s"], 1)
+        self.assertEqual(report["latency_histogram"]["<= 0.25s"], 1)
+        self.assertEqual(report["latency_histogram"]["<= 5s"], 1)
+
+    def test_retries_search_totals_and_phases_counted(self):
+        with unittest.mock.patch.object(jira_blocker_analyser.time, "sleep"):
+            func = unittest.mock.MagicMock(side_effect=[JiraErrorStub(429, {"Retry-After": "0"}), "ok"])
+            with unittest.mock.patch.object(jira_blocker_analyser, "rate_limiter", RateLimiter()):
+                call_with_retry(func)
+        jira = make_search_jira({"q1": ["PROJ-1", "PROJ-2", "PROJ-3"], "q2": ["PROJ-4"]})
+        list(search_sharded(jira, ["q1", "q2"], page_size=2))
+        report = self.metrics.report()
+        self.assertEqual(report["retries"], 1)
+        self.assertEqual(self.metrics.expected_issues, 4)
+        self.assertEqual(report["phases"]["search"]["calls"], 3)
+
+    def test_progress_line_shows_rate_and_eta(self):
+        self.metrics.expected_issues = 100
+        out = io.StringIO()
+        progress = ProgressLine(out)
+        progress.start -= 10
+        progress.update(20, 30)
+        progress.update(21, 30)  # within PROGRESS_INTERVAL, not redrawn
+        self.assertEqual(out.getvalue().count("\r"), 1)
+        self.assertIn("Issues: 20, blockers: 30, 2.0 issues/s, ETA 0:00:40", out.getvalue())
+
+    def test_sampling_profiler_records_worker_stacks(self):
+        def busy_worker():
+            deadline = time.perf_counter() + 0.2
+            while time.perf_counter() < deadline:
+                pass
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        worker = threading.Thread(target=busy_worker)
+        worker.start()
+        worker.join()
+        profiler.stop()
+        self.assertTrue(any("busy_worker" in frame for frame, _, _ in profiler.top()))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stacks.txt")
+            profiler.save(path)
+            with open(path, encoding="utf-8") as f:
+                line = f.readline()
+        self.assertRegex(line, r"^.+;.+ \d+$")
+
+
 class TestBlockerCategoryFromComment(unittest.TestCase):
     def test_returns_category_when_pattern_matches_and_time_equals(self):
         comments = [
@@ -295,6 +1732,220 @@ class TestCommentsText(unittest.TestCase):
         )
 
 
+class TestParseJiraTime(unittest.TestCase):
+    def test_same_result_as_strptime(self):
+        for value in ("2024-01-15T10:00:00.000+0000", "2024-01-15T10:00:00.123456+0000",
+                      "2024-07-01T23:59:59.999+0300", "2024-01-15T10:00:00.000-0530"):
+            self.assertEqual(parse_jira_time(value), datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z"))
+
+    def test_offset_with_colon_and_naive_time(self):
+        self.assertEqual(parse_jira_time("2024-01-15T10:00:00.000+03:00"),
+                         datetime(2024, 1, 15, 10, tzinfo=timezone(timedelta(hours=3))))
+        self.assertEqual(parse_jira_time("2024-01-15T10:00:00"), datetime(2024, 1, 15, 10))
+
+    def test_category_matched_across_timezones_and_milliseconds(self):
+        comments = [make_comment("2024-01-15T13:00:00.350+0300", "Blocker #vendor")]
+        flag_set_time = parse_jira_time("2024-01-15T10:00:00.120+0000")
+        self.assertEqual(blocker_category_from_comment(comments, flag_set_time, r"#\w+"), "#vendor")
+
+    def test_comments_text_with_naive_flag_times(self):
+        comments = [make_comment("2024-01-15T11:00:00.000+0000", "In range")]
+        self.assertEqual(comments_text(comments, datetime(2024, 1, 15, 10), datetime(2024, 1, 15, 12)),
+                         "In range\n---\n")
+
+
+def comment_with_id(comment_id, created, body):
+    return SimpleNamespace(id=comment_id, created=created, body=body)
+
+
+class TestCategoryRules(unittest.TestCase):
+    RULES = [
+        ("Infrastructure", r"#infra\w*|\{infra\}"),
+        (None, r"\[[\w-]+\]"),
+        (None, r"#\w+"),
+    ]
+    KEYWORDS = {"vendor": "Vendor", "Third Party": "Vendor", "third-party vendor": "Vendor", "stand": "Infrastructure"}
+
+    def rules(self):
+        return CategoryRules(self.RULES, self.KEYWORDS)
+
+    def test_first_match_in_text_decides_then_rule_order(self):
+        rules = self.rules()
+        self.assertEqual(rules.classify("Stand is down #infrastructure"), "Infrastructure")
+        self.assertEqual(rules.classify("{infra} again"), "Infrastructure")
+        self.assertEqual(rules.classify("Waiting for the Third  Party"), "")
+        self.assertEqual(rules.classify("Waiting for the THIRD PARTY, #infra later"), "Vendor")
+        self.assertEqual(rules.classify("Vendors are not a keyword, [legal-review] is"), "[legal-review]")
+        self.assertEqual(rules.classify("#infra #other"), "Infrastructure")  # both rules match at 0, first listed wins
+        self.assertEqual(rules.classify("#other #infra"), "#other")
+        self.assertEqual(rules.classify("nothing here"), "")
+        self.assertEqual(rules.classify("A third-party vendor, standing by"), "Vendor")
+        self.assertEqual(rules.classify("The standing stand"), "Infrastructure")
+
+    def test_lookahead_prefilter_only_for_literal_first_characters(self):
+        self.assertTrue(CategoryRules([("A", r"#a\w*"), ("B", r"\{b\}")], {"c": "C"}).regex.pattern.startswith(r"(?=[\#Cc\{])"))
+        self.assertFalse(CategoryRules([("A", r"#a"), ("B", r"#?b")]).regex.pattern.startswith("(?="))
+        self.assertFalse(CategoryRules([("A", r"#a|b")] * 2).regex.pattern.startswith("(?="))
+
+    def test_trie_pattern_matches_exactly_the_words(self):
+        words = ["reason", "reason 1", "reason 12", "reasons", "cause", "because of"]
+        regex = re.compile(f"(?:{jira_blocker_analyser.trie_pattern(words)})$")
+        self.assertTrue(all(regex.match(word) for word in words))
+        self.assertFalse(any(regex.match(word) for word in ["reason 2", "reason 1 ", "causes", "because", ""]))
+
+    def test_single_pattern_keeps_its_inline_flags_and_groups(self):
+        self.assertEqual(CategoryRules([(None, r"(?i)blocked by (\w+)")]).classify("BLOCKED BY legal"), "BLOCKED BY legal")
+
+    def test_category_memoised_per_comment_until_the_body_changes(self):
+        rules = self.rules()
+        comment = comment_with_id("10001", "2024-01-15T10:00:00.000+0000", "#infra")
+        with unittest.mock.patch.object(rules, "classify", wraps=rules.classify) as classify:
+            self.assertEqual([rules.comment_category(comment) for _ in range(3)], ["Infrastructure"] * 3)
+            self.assertEqual(classify.call_count, 1)
+            comment.body = "vendor delay"
+            self.assertEqual(rules.comment_category(comment), "Vendor")
+            self.assertEqual(classify.call_count, 2)
+
+    def test_category_from_the_blocked_interval(self):
+        comments = [comment_with_id("1", "2024-01-15T10:00:00.000+0000", "(flag) Flag added"),
+                    comment_with_id("2", "2024-01-15T11:00:00.000+0000", "It is the vendor"),
+                    comment_with_id("3", "2024-01-15T13:00:00.000+0000", "#infra after the flag")]
+        flag_set = datetime(2024, 1, 15, 10, tzinfo=timezone.utc)
+        rules = self.rules()
+        self.assertEqual(blocker_category_from_comment(comments, flag_set, rules), "")
+        self.assertEqual(blocker_category_from_comment(comments, flag_set, rules, flag_set + timedelta(hours=1)), "Vendor")
+        self.assertEqual(blocker_category_from_comment(comments, flag_set, r"#\w+", flag_set + timedelta(hours=2)), "")
+
+    def test_patterns_that_break_next_to_other_rules_are_rejected(self):
+        self.assertIn("named groups", rule_pattern_error(r"""(["'])blk\1"""))
+        self.assertIn("named groups", rule_pattern_error(r"(a)?(?(1)b|c)"))
+        self.assertIn("inline flags", rule_pattern_error(r"(?i)blocked by"))
+        self.assertIn("not a regular expression", rule_pattern_error(r"#[a-"))
+        self.assertIsNone(rule_pattern_error(r"(?i)blocked by", combined=False))
+        self.assertIsNone(rule_pattern_error(r"\\1|(?i:blocked)"))
+        rules = CategoryRules([("Quoted", r"""(?P<q>["'])blk(?P=q)"""), (None, r"#\w+")])
+        self.assertEqual([rules.classify(text) for text in ("'blk'", "#infra", "'blk\"")], ["Quoted", "#infra", ""])
+
+    @unittest.skipUnless(importlib.util.find_spec("yaml"), "PyYAML is not installed")
+    def test_rules_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rules.yaml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("rules:\n"
+                        "- category: Infrastructure\n"
+                        "  patterns: ['#infra\\w*', '\\{infra\\}']\n"
+                        "  keywords: [test stand]\n"
+                        "- category: Vendor\n"
+                        "  keywords: [vendor, supplier]\n"
+                        "- pattern: '#\\w+'\n")
+            rules = load_category_rules(path)
+            self.assertEqual([rules.classify(text) for text in ("The Test Stand is down", "{infra}", "supplier", "#legal")],
+                             ["Infrastructure", "Infrastructure", "Vendor", "#legal"])
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("- category: Vendor\n")
+            with self.assertRaises(ValueError):
+                load_category_rules(path)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("- pattern: '(?i)blocked by'\n")
+            self.assertEqual(load_category_rules(path).classify("BLOCKED BY legal"), "BLOCKED BY")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("- pattern: '(?i)blocked by'\n"
+                        "- pattern: '#\\w+'\n")
+            with self.assertRaisesRegex(ValueError, "inline flags"):
+                load_category_rules(path)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("- category: Quoted\n"
+                        "  pattern: \"(?P<q>['])blk(?P=q)\"\n"
+                        "- category: Double quoted\n"
+                        "  pattern: '(?P<q>\")wait(?P=q)'\n")
+            with self.assertRaisesRegex(ValueError, f"{re.escape(path)} cannot be combined.*'q'"):
+                load_category_rules(path)
+            for empty in ("[]\n", "rules: []\n", ""):
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(empty)
+                with self.assertRaisesRegex(ValueError, "No category rules"):
+                    load_category_rules(path)
+
+
+class TestStartup(unittest.TestCase):
+    """Heavy dependencies are imported only by the code paths that need them."""
+    HEAVY = ["jira", "requests", "pandas", "numpy", "pyarrow", "openpyxl", "yaml", "http.server", "multiprocessing"]
+    ROOT = os.path.dirname(os.path.abspath(__file__))
+
+    def loaded_after(self, code):
+        script = code + f"\nimport sys\nprint(' '.join(sorted(set({self.HEAVY!r}) & set(sys.modules))))"
+        result = subprocess.run([sys.executable, "-c", script], cwd=self.ROOT, capture_output=True, text=True, check=True)
+        return result.stdout.split()
+
+    def test_import_and_help(self):
+        self.assertEqual(self.loaded_after("import jira_blocker_analyser.analyser"), [])
+        self.assertEqual(self.loaded_after("import sys, contextlib, io\n"
+                                           "sys.argv = ['jira-blocker-analyser', '--help']\n"
+                                           "from jira_blocker_analyser.analyser import main\n"
+                                           "with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):\n"
+                                           "    main()"), [])
+
+    def test_offline_csv_run_does_not_load_jira(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "export.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump([make_raw_issue("PROJ-1")], f)
+            argv = ["jira-blocker-analyser", "--input-file", path, "--mode", "csv", "--output-file", os.path.join(tmp, "out")]
+            loaded = self.loaded_after("import sys, contextlib, io\n"
+                                       f"sys.argv = {argv!r}\n"
+                                       "from jira_blocker_analyser.analyser import main\n"
+                                       "with contextlib.redirect_stdout(io.StringIO()):\n"
+                                       "    main()")
+            self.assertEqual(loaded, [])
+            self.assertEqual(len([name for name in os.listdir(tmp) if name.endswith(".csv")]), 1)
+
+    def test_input_file_cannot_be_used_with_cache_dir(self):
+        argv = ["jira-blocker-analyser", "--input-file", "export.json", "--cache-dir", "cache"]
+        with unittest.mock.patch.object(sys, "argv", argv), unittest.mock.patch("sys.stderr", io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit) as raised:
+                jira_blocker_analyser.main()
+        self.assertEqual(raised.exception.code, 2)
+        self.assertIn("--cache-dir", stderr.getvalue())
+
+    def test_old_script_name_still_runs(self):
+        result = subprocess.run([sys.executable, "jira-blocker-analyser.py", "--help"], cwd=self.ROOT,
+                                capture_output=True, text=True, check=True)
+        self.assertIn("usage: jira-blocker-analyser", result.stdout)
+
+
+class TestCommentIndex(unittest.TestCase):
+    def test_between_sorts_unordered_comments_and_includes_bounds(self):
+        index = CommentIndex([
+            make_comment("2024-01-15T12:00:00.000000+0000", "End"),
+            make_comment("2024-01-15T09:00:00.000000+0000", "Before"),
+            make_comment("2024-01-15T10:00:00.000000+0000", "Start"),
+            make_comment("2024-01-15T11:00:00.000000+0000", "Middle"),
+        ])
+        flag_set = datetime(2024, 1, 15, 10, 0, 0, tzinfo=timezone.utc)
+        flag_removed = datetime(2024, 1, 15, 12, 0, 0, tzinfo=timezone.utc)
+        self.assertEqual(index.between(flag_set, flag_removed), ["Start", "Middle", "End"])
+        self.assertEqual(comments_text(index, flag_set, flag_removed), "Start\n---\nMiddle\n---\nEnd\n---\n")
+
+    def test_at_returns_all_comments_of_that_second_in_original_order(self):
+        index = CommentIndex([
+            make_comment("2024-01-15T10:00:00.500", "Second"),
+            make_comment("2024-01-15T09:00:00", "Other"),
+            make_comment("2024-01-15T10:00:00.100", "Third #found"),
+        ])
+        self.assertEqual(index.at(datetime(2024, 1, 15, 10, 0, 0)), ["Second", "Third #found"])
+        self.assertEqual(index.at(datetime(2024, 1, 15, 11, 0, 0)), [])
+        self.assertEqual(blocker_category_from_comment(index, datetime(2024, 1, 15, 10, 0, 0), r"#\w+"), "#found")
+
+    def test_comments_parsed_once_for_many_lookups(self):
+        comment = make_comment("2024-01-15T11:00:00.000000+0000", "Only one")
+        created = unittest.mock.PropertyMock(return_value="2024-01-15T11:00:00.000000+0000")
+        type(comment).created = created
+        index = CommentIndex([comment])
+        for hour in range(10, 20):
+            index.between(datetime(2024, 1, 15, hour, tzinfo=timezone.utc), datetime(2024, 1, 15, 23, tzinfo=timezone.utc))
+        self.assertEqual(created.call_count, 1)
+
+
 class TestBlockerInfoToDict(unittest.TestCase):
     def setUp(self):
         jira_blocker_analyser.category_pattern = r"#\w+"
@@ -357,9 +2008,8 @@ class TestBlockerInfoToDict(unittest.TestCase):
         result = blocker_info_to_dict(issue, flag_set, flag_removed, comments, False)
         self.assertFalse(result["Flag was not removed"])
 
-    def test_blocker_category_key_present(self):
-        """Blocker Category key is present; value comes from blocker_category_from_comment.
-        With timezone-aware flag_set, category can be empty due to naive/aware comparison in current code."""
+    def test_blocker_category_found_for_timezone_aware_flag_time(self):
+        """Blocker Category comes from blocker_category_from_comment; aware flag and comment times are matched."""
         issue = self._make_issue()
         flag_set = datetime(2024, 1, 15, 10, 0, 0, tzinfo=timezone.utc)
         flag_removed = datetime(2024, 1, 16, 10, 0, 0, tzinfo=timezone.utc)
@@ -367,9 +2017,7 @@ class TestBlockerInfoToDict(unittest.TestCase):
             make_comment("2024-01-15T10:00:00.000000+0000", "Blocker #deployment"),
         ]
         result = blocker_info_to_dict(issue, flag_set, flag_removed, comments, False)
-        self.assertIn("Blocker Category", result)
-        # Category lookup uses naive comment time; with aware flag_set they don't match, so '' here
-        self.assertEqual(result["Blocker Category"], "")
+        self.assertEqual(result["Blocker Category"], "#deployment")
 
     def test_comments_text_in_range_in_result(self):
         issue = self._make_issue()
@@ -384,6 +2032,45 @@ class TestBlockerInfoToDict(unittest.TestCase):
         self.assertEqual(result["Time Blocked"], 2 * 3600)  # 2 hours in seconds
 
 
+class TestBlockerRecord(unittest.TestCase):
+    def test_dict_form_matches_former_blocker_dict(self):
+        blocker = make_blocker(seconds=5400, not_removed=True)
+        self.assertEqual(blocker.to_dict(), {
+            "Issue Key": "PROJ-1",
+            "Issue Summary": "Blocked task",
+            "Flag Set Time": "2024-01-15 10:00",
+            "Flag Removed Time": "2024-01-15 11:30",
+            "Time Blocked": 5400,
+            "Blocker Category": "#infra",
+            "Comments": "Waiting\n---\n",
+            "Flag was not removed": True,
+        })
+        self.assertEqual(blocker["Comments"], "Waiting\n---\n")
+        self.assertEqual(list(blocker.keys()), list(blocker.to_dict()))
+
+    def test_record_has_no_instance_dict(self):
+        blocker = make_blocker()
+        self.assertFalse(hasattr(blocker, "__dict__"))
+        with self.assertRaises(AttributeError):
+            blocker.extra = 1
+
+    def test_blockers_of_an_issue_share_one_comment_index(self):
+        jira_blocker_analyser.category_pattern = r"#\w+"
+        histories = [
+            make_history("2024-01-15T10:00:00.000000+0000", [make_changelog_item("Flagged", to_string="Impediment")]),
+            make_history("2024-01-15T11:00:00.000000+0000", [make_changelog_item("Flagged", from_string="Impediment")]),
+            make_history("2024-01-16T10:00:00.000000+0000", [make_changelog_item("Flagged", to_string="Impediment")]),
+            make_history("2024-01-16T11:00:00.000000+0000", [make_changelog_item("Flagged", from_string="Impediment")]),
+        ]
+        issue = make_expanded_issue("PROJ-1", "Two blocks", histories, [
+            make_comment("2024-01-15T10:30:00.000000+0000", "First"),
+            make_comment("2024-01-16T10:30:00.000000+0000", "Second"),
+        ])
+        first, second = process_issue(unittest.mock.MagicMock(), issue)
+        self.assertIs(first.comments, second.comments)
+        self.assertEqual((first["Comments"], second["Comments"]), ("First\n---\n", "Second\n---\n"))
+
+
 class TestFormatBlockingTime(unittest.TestCase):
     """Conversion from seconds to display value (only at output time)."""
 